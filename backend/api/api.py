@@ -3,4 +3,6 @@ from django.urls import path, include
 
 urlpatterns = [
     path('', include('quiz.api')),
+    # Асинхронные эндпоинты чтения, работают при запуске через ASGI.
+    path('async/', include('quiz.async_api')),
 ]
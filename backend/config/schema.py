@@ -0,0 +1,49 @@
+import json
+import os
+from collections import OrderedDict
+from functools import lru_cache
+
+from django.conf import settings
+from rest_framework.response import Response
+
+from drf_yasg import openapi
+from drf_yasg.codecs import OpenAPICodecJson
+from drf_yasg.views import SPEC_RENDERERS, get_schema_view
+
+
+INFO = openapi.Info(title="QuizAPI", default_version='v1')
+
+# Swagger Header
+schema_view = get_schema_view(INFO, url=settings.API_URL, public=True)
+
+
+def generate_schema():
+    # Обходит все представления и их swagger_auto_schema - медленно, поэтому схема собирается заранее.
+    return schema_view.generator_class(INFO, url=settings.API_URL).get_schema(request=None, public=True)
+
+
+def encode_schema(schema):
+    return OpenAPICodecJson(validators=[], pretty=True).encode(schema)
+
+
+def load_schema(path):
+    with open(path, encoding='utf-8') as schema_file:
+        data = json.load(schema_file, object_pairs_hook=OrderedDict)
+    # Рендереры drf_yasg принимают только openapi.Swagger, конструктор которого требует исходные объекты.
+    schema = openapi.Swagger.__new__(openapi.Swagger)
+    OrderedDict.__init__(schema, data)
+    return schema
+
+
+@lru_cache(maxsize=None)
+def get_schema():
+    # Файл из generate_openapi_schema, если его нет - схема собирается один раз на процесс.
+    if os.path.exists(settings.OPENAPI_SCHEMA_PATH): return load_schema(settings.OPENAPI_SCHEMA_PATH)
+    return generate_schema()
+
+
+class SchemaView(schema_view):
+    def get(self, request, version='', format=None):
+        # Страница Swagger UI схему не содержит, ее строит стандартное представление.
+        if not isinstance(request.accepted_renderer, SPEC_RENDERERS): return super().get(request, version, format)
+        return Response(get_schema())
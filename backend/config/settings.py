@@ -1,4 +1,6 @@
 import os
+from importlib.util import find_spec
+
 import environ
 
 
@@ -40,6 +42,7 @@ LOCAL_APPS = [
 
 INSTALLED_APPS = DJANGO_APPS + THIRD_APPS + LOCAL_APPS
 MIDDLEWARE = [
+    'quiz.middleware.MetricsMiddleware',     # время и число запросов к базе по эндпоинтам
     'django.middleware.security.SecurityMiddleware',
     # 'whitenoise.middleware.WhiteNoiseMiddleware',    #add whitenoise
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -112,12 +115,36 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'config.wsgi.application'
+ASGI_APPLICATION = 'config.asgi.application'
 # SESSION_ENGINE = "django.contrib.sessions.backends.cached_db"
 
 
 DATABASES = {
     'default': env.db()
 }
+# Реплики для чтения: DATABASE_REPLICA_URLS=sqlite:///replica.sqlite3,mysql://... В тестах реплики
+# смотрят в тестовую базу default.
+DATABASE_REPLICAS = []
+for i, url in enumerate(env.list('DATABASE_REPLICA_URLS', default=[])):
+    DATABASES[f'replica_{i}'] = dict(env.db_url_config(url), TEST={'MIRROR': 'default'})
+    DATABASE_REPLICAS.append(f'replica_{i}')
+DATABASE_ROUTERS = ['quiz.routers.ReplicaRouter']
+# Сколько секунд после отправки ответов пользователь читает с основной базы.
+DATABASE_REPLICA_STICKY_TIMEOUT = env.int('DATABASE_REPLICA_STICKY_TIMEOUT', default=10)
+
+# locmemcache:// или filecache:///tmp/quiz_cache для локального запуска. Кеш процесса (locmem) не видит изменений
+# из других процессов: с несколькими воркерами нужен общий кеш (memcached, redis).
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://')
+}
+# Время жизни снимка опроса в секундах. none - пока опрос не изменится, только с общим кешем (проверка quiz.E001).
+QUIZ_SNAPSHOT_TIMEOUT = env.str('QUIZ_SNAPSHOT_TIMEOUT', default='300')
+QUIZ_SNAPSHOT_TIMEOUT = None if QUIZ_SNAPSHOT_TIMEOUT.lower() == 'none' else int(QUIZ_SNAPSHOT_TIMEOUT)
+# Синхронизация активных опросов (quiz/active/?since=...): на сколько секунд назад от токена смотреть изменения.
+# Покрывает транзакции, зафиксированные после выдачи токена, и отставание реплик.
+ACTIVE_QUIZ_SYNC_OVERLAP = env.int('ACTIVE_QUIZ_SYNC_OVERLAP', default=5)
+# Набор id активных опросов живет до ближайшего начала или конца опроса, но не дольше этого числа секунд.
+ACTIVE_QUIZ_IDS_TIMEOUT = env.int('ACTIVE_QUIZ_IDS_TIMEOUT', default=300)
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -150,13 +177,35 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'dist', 'static')
 ##########
 # API #
 ##########
+# Формат ответа выбирается по заголовку Accept (или ?format=json|msgpack), по умолчанию JSON.
+# MessagePack доступен, только если установлен msgpack.
+RENDERER_CLASSES = ['quiz.renderers.ORJSONRenderer']
+if find_spec('msgpack'): RENDERER_CLASSES.append('quiz.renderers.MessagePackRenderer')
+RENDERER_CLASSES.append('rest_framework.renderers.BrowsableAPIRenderer')
+
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.AllowAny',
     ),
+    'DEFAULT_RENDERER_CLASSES': RENDERER_CLASSES,
 }
 
 API_URL = env.str('API_URL')
+# Заранее собранная схема для /swagger/: python manage.py generate_openapi_schema
+OPENAPI_SCHEMA_PATH = env.str('OPENAPI_SCHEMA_PATH', default=os.path.join(BASE_DIR, 'dist', 'openapi.json'))
+
+# Запись ответов через очередь: запрос только проверяет ответы, в базу их переносит manage.py answer_queue.
+ANSWER_QUEUE_ENABLED = env.bool('ANSWER_QUEUE_ENABLED', default=False)
+ANSWER_QUEUE_PATH = env.str('ANSWER_QUEUE_PATH', default=os.path.join(BASE_DIR, 'data', 'answer_queue.sqlite3'))
+# Сколько секунд запись из очереди закреплена за воркером, потом ее может взять другой.
+ANSWER_QUEUE_LEASE_TIMEOUT = env.int('ANSWER_QUEUE_LEASE_TIMEOUT', default=300)
+
+# Запросы дольше порога (в секундах) пишутся в лог вместе с SQL.
+SLOW_REQUEST_THRESHOLD = env.float('SLOW_REQUEST_THRESHOLD', default=1.0)
+
+# Кеш токенов пользователей в памяти процесса.
+TOKEN_CACHE_SIZE = env.int('TOKEN_CACHE_SIZE', default=10000)
+TOKEN_CACHE_TTL = env.int('TOKEN_CACHE_TTL', default=60)
 
 
 # # Fake PyMySQL's version and install as MySQLdb add to __init__
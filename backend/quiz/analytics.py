@@ -0,0 +1,89 @@
+from itertools import chain
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .models import UserAnswer, VariableAnswer
+
+
+class QuizMatrix:
+    # Ответы на опрос в виде матрицы пользователи x варианты ответа (bool).
+    # Строки - пользователи, выбравшие хотя бы один вариант, столбцы - варианты в порядке вопросов.
+    def __init__(self, visitor_ids, option_ids, option_questions, matrix):
+        self.visitor_ids = visitor_ids
+        self.option_ids = option_ids
+        self.option_questions = option_questions
+        self.matrix = matrix
+
+    @classmethod
+    def from_pairs(cls, pairs, option_ids, option_questions):
+        # pairs - массив (n, 2): id пользователя, id выбранного варианта.
+        option_ids = np.asarray(option_ids, dtype=np.int64)
+        option_questions = np.asarray(option_questions, dtype=np.int64)
+        pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+
+        visitor_ids, rows = np.unique(pairs[:, 0], return_inverse=True)
+        order = np.argsort(option_ids)
+        columns = order[np.searchsorted(option_ids, pairs[:, 1], sorter=order)]
+        matrix = np.zeros((len(visitor_ids), len(option_ids)), dtype=bool)
+        matrix[rows, columns] = True
+        return cls(visitor_ids, option_ids, option_questions, matrix)
+
+    @property
+    def respondents(self):
+        return len(self.visitor_ids)
+
+    def columns(self, question_id):
+        return np.flatnonzero(self.option_questions == question_id)
+
+    def distribution(self):
+        return self.matrix.sum(axis=0)
+
+    def crosstab(self, question_a, question_b):
+        # Сколько пользователей выбрали вариант i вопроса A и вариант j вопроса B.
+        # float32 считается через BLAS и точен для счетчиков до 2**24.
+        a = self.matrix[:, self.columns(question_a)].astype(np.float32)
+        b = self.matrix[:, self.columns(question_b)].astype(np.float32)
+        return (a.T @ b).astype(np.int64)
+
+    def cooccurrence(self):
+        matrix = self.matrix.astype(np.float32)
+        return (matrix.T @ matrix).astype(np.int64)
+
+
+def load_quiz_matrix(quiz_id, chunk_size=10000):
+    options = list(VariableAnswer.objects.filter(question__quiz_id=quiz_id).order_by('question__position', 'id')
+                   .values_list('id', 'question_id', 'text'))
+    pairs = UserAnswer.variable_answer.through.objects.filter(useranswer__question__quiz_id=quiz_id).order_by(
+    ).values_list('useranswer__visitor_id', 'variableanswer_id').iterator(chunk_size=chunk_size)
+    pairs = np.fromiter(chain.from_iterable(pairs), dtype=np.int64)
+
+    matrix = QuizMatrix.from_pairs(pairs, [_[0] for _ in options], [_[1] for _ in options])
+    return matrix, options
+
+
+def serialize_options(options, question_id):
+    return [{'id': option_id, 'text': text} for option_id, option_question_id, text in options
+            if option_question_id == question_id]
+
+
+def quiz_analytics(quiz_id, kind, question_a=None, question_b=None):
+    matrix, options = load_quiz_matrix(quiz_id)
+    data = {'quiz': quiz_id, 'respondents': matrix.respondents}
+
+    if kind == 'crosstab':
+        data.update({'question_a': {'id': question_a, 'variable_answer': serialize_options(options, question_a)},
+                     'question_b': {'id': question_b, 'variable_answer': serialize_options(options, question_b)},
+                     'table': matrix.crosstab(question_a, question_b).tolist()})
+    elif kind == 'cooccurrence':
+        data.update({'variable_answer': [{'id': option_id, 'text': text} for option_id, _, text in options],
+                     'table': matrix.cooccurrence().tolist()})
+    else:
+        distribution = matrix.distribution().tolist()
+        data.update({'variable_answer': [
+            {'id': option_id, 'question': question_id, 'text': text, 'count': count,
+             'percent': round(count * 100 / matrix.respondents, 2) if matrix.respondents else 0}
+            for (option_id, question_id, text), count in zip(options, distribution)]})
+    return data
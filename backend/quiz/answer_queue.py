@@ -0,0 +1,81 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from django.conf import settings
+
+
+class AnswerQueue:
+    # Локальная очередь ответов в отдельном файле SQLite. Запись переживает перезапуск процесса,
+    # в visitor_answers ответы переносит воркер (manage.py answer_queue).
+    def __init__(self):
+        self._local = threading.local()
+
+    @property
+    def connection(self):
+        # Путь читаем при каждом обращении, чтобы работал override_settings в тестах.
+        path = settings.ANSWER_QUEUE_PATH
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.path != path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            connection = sqlite3.connect(path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS answer_queue ('
+                               'id INTEGER PRIMARY KEY AUTOINCREMENT, visitor_id INTEGER NOT NULL, '
+                               'quiz_id INTEGER NOT NULL, answers TEXT NOT NULL, created REAL NOT NULL, '
+                               'failed INTEGER NOT NULL DEFAULT 0, claimed_by TEXT, claimed_at REAL)')
+            # Очередь, созданная до появления аренды записей.
+            columns = {row[1] for row in connection.execute('PRAGMA table_info(answer_queue)')}
+            if 'claimed_by' not in columns:
+                connection.execute('ALTER TABLE answer_queue ADD COLUMN claimed_by TEXT')
+                connection.execute('ALTER TABLE answer_queue ADD COLUMN claimed_at REAL')
+            self._local.connection, self._local.path = connection, path
+        return connection
+
+    def put(self, visitor_id, quiz_id, answers):
+        self.connection.execute('INSERT INTO answer_queue (visitor_id, quiz_id, answers, created) VALUES (?, ?, ?, ?)',
+                                (visitor_id, quiz_id, json.dumps(answers), time.time()))
+
+    def take(self, batch_size):
+        # Записи берутся в аренду на ANSWER_QUEUE_LEASE_TIMEOUT секунд: другой воркер их не получит,
+        # а если воркер упал, не подтвердив их, после окончания аренды они снова попадут в выборку.
+        claim, now = uuid.uuid4().hex, time.time()
+        connection = self.connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute('UPDATE answer_queue SET claimed_by = ?, claimed_at = ? WHERE id IN ('
+                               'SELECT id FROM answer_queue WHERE failed = 0 AND (claimed_at IS NULL OR claimed_at < ?) '
+                               'ORDER BY id LIMIT ?)', (claim, now, now - settings.ANSWER_QUEUE_LEASE_TIMEOUT, batch_size))
+            rows = connection.execute('SELECT id, visitor_id, quiz_id, answers FROM answer_queue WHERE claimed_by = ? '
+                                      'ORDER BY id', (claim,)).fetchall()
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        return [(item_id, visitor_id, quiz_id, json.loads(answers)) for item_id, visitor_id, quiz_id, answers in rows]
+
+    def ack(self, ids):
+        self.connection.executemany('DELETE FROM answer_queue WHERE id = ?', [(_,) for _ in ids])
+
+    def release(self, ids):
+        # Вернуть записи в очередь до окончания аренды, например, если база недоступна.
+        self.connection.executemany('UPDATE answer_queue SET claimed_by = NULL, claimed_at = NULL WHERE id = ?',
+                                    [(_,) for _ in ids])
+
+    def fail(self, ids):
+        self.connection.executemany('UPDATE answer_queue SET failed = 1, claimed_by = NULL, claimed_at = NULL '
+                                    'WHERE id = ?', [(_,) for _ in ids])
+
+    def retry_failed(self):
+        return self.connection.execute('UPDATE answer_queue SET failed = 0 WHERE failed = 1').rowcount
+
+    def depth(self):
+        pending, failed = self.connection.execute('SELECT COUNT(*) - COALESCE(SUM(failed), 0), COALESCE(SUM(failed), 0) '
+                                                  'FROM answer_queue').fetchone()
+        return {'pending': pending, 'failed': failed}
+
+
+answer_queue = AnswerQueue()
@@ -4,8 +4,13 @@ from . import views
 
 urlpatterns = [
     path('quiz/', views.QuizAPIView.as_view(), name='quiz'),
+    path('quiz/batch/', views.QuizBatchAPIView.as_view(), name='quiz_batch'),
     path('question/', views.QuestionAPIView.as_view(), name='question'),
     path('quiz/active/', views.ActiveQuizAPIView.as_view(), name='active_quiz'),
+    path('quiz/stats/', views.QuizStatsAPIView.as_view(), name='quiz_stats'),
+    path('quiz/analytics/', views.QuizAnalyticsAPIView.as_view(), name='quiz_analytics'),
+    path('quiz/export/', views.QuizExportAPIView.as_view(), name='quiz_export'),
     path('quiz/create_answer/', views.QuizCreateAnswerAPIView.as_view(), name='active_answer'),
-    path('visitor/answers/', views.VisitorHistoryAnswerAPIView.as_view(), name='active_answer'),
+    path('search/', views.SearchAPIView.as_view(), name='search'),
+    path('visitor/answers/', views.VisitorHistoryAnswerAPIView.as_view(), name='visitor_answers'),
 ]
@@ -1,5 +1,26 @@
 from django.apps import AppConfig
+from django.contrib.auth import get_user_model
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
 
 
 class QuizConfig(AppConfig):
     name = 'quiz'
+
+    def ready(self):
+        from . import checks  # регистрирует проверки настроек
+        from .middleware import install_query_recorder
+        from .models import Quiz, TypeQuestion
+        from .registry import invalidate_type_questions
+        from .services import record_quiz_deletion
+        from .snapshots import invalidate_active_quizzes
+        from .tokens import invalidate_user
+
+        post_save.connect(invalidate_user, sender=get_user_model(), dispatch_uid='quiz_token_cache_save')
+        post_delete.connect(invalidate_user, sender=get_user_model(), dispatch_uid='quiz_token_cache_delete')
+        post_save.connect(invalidate_type_questions, sender=TypeQuestion, dispatch_uid='quiz_type_question_save')
+        post_delete.connect(invalidate_type_questions, sender=TypeQuestion, dispatch_uid='quiz_type_question_delete')
+        post_save.connect(invalidate_active_quizzes, sender=Quiz, dispatch_uid='quiz_active_quizzes_save')
+        post_delete.connect(invalidate_active_quizzes, sender=Quiz, dispatch_uid='quiz_active_quizzes_delete')
+        post_delete.connect(record_quiz_deletion, sender=Quiz, dispatch_uid='quiz_tombstone')
+        connection_created.connect(install_query_recorder, dispatch_uid='quiz_query_recorder')
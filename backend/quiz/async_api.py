@@ -0,0 +1,9 @@
+from django.urls import path
+from . import async_views
+
+
+urlpatterns = [
+    path('quiz/', async_views.quiz_view, name='async_quiz'),
+    path('quiz/active/', async_views.active_quiz_view, name='async_active_quiz'),
+    path('visitor/answers/', async_views.visitor_history_answer_view, name='async_visitor_answers'),
+]
@@ -0,0 +1,109 @@
+from asgiref.sync import SyncToAsync
+from django.db import close_old_connections
+from django.http import HttpResponse
+from rest_framework import status
+
+from . import services
+from .renderers import ORJSONRenderer
+from .views import HISTORY_MAX_LIMIT, not_modified, parse_int, set_validators
+
+
+# Асинхронные версии эндпоинтов чтения для запуска через ASGI (config/asgi.py).
+# ORM в Django 3.1 синхронный, поэтому сервисы вызываются через sync_to_async,
+# а воркер не блокируется на время ожидания базы. Потоковой выдачи истории (stream=1) здесь нет:
+# ASGI-обработчик Django 3.1 читает StreamingHttpResponse прямо в цикле событий.
+
+
+class DatabaseSyncToAsync(SyncToAsync):
+    # Как database_sync_to_async в channels: вызов идет в общем пуле потоков, у каждого потока свое соединение.
+    # thread_sensitive=True в asgiref 3.2 выполняет все вызовы всех запросов в одном потоке, по очереди.
+    # Соединение закрывается после вызова (с учетом CONN_MAX_AGE), иначе потоки пула держали бы их вечно.
+    def thread_handler(self, loop, *args, **kwargs):
+        close_old_connections()
+        try:
+            return super().thread_handler(loop, *args, **kwargs)
+        finally:
+            close_old_connections()
+
+
+def database_sync_to_async(func):
+    return DatabaseSyncToAsync(func, thread_sensitive=False)
+
+
+def json_response(data, status_code):
+    # Ответ 204 не может содержать тела, ASGI-серверы (uvicorn/h11) разрывают такое соединение.
+    if status_code == status.HTTP_204_NO_CONTENT: return HttpResponse(status=status_code)
+    return HttpResponse(ORJSONRenderer().render(data), content_type='application/json', status=status_code)
+
+
+async def quiz_view(request):
+    quiz_id = request.GET.get('quiz', None)
+
+    if not quiz_id: return json_response({'error': 'В запросе отсутсвуют обязательные параметры.'},
+                                         status.HTTP_400_BAD_REQUEST)
+    try:
+        quiz_id = parse_int(quiz_id)
+    except ValueError:
+        return json_response({'error': 'Проверьте формат'}, status.HTTP_400_BAD_REQUEST)
+
+    quiz = await database_sync_to_async(services.get_quiz_snapshot)(quiz_id=quiz_id)
+    if not quiz: return json_response({'message': 'Опрос не найден.'}, status.HTTP_204_NO_CONTENT)
+    response = not_modified(request, quiz.etag, quiz.last_modified)
+    if response: return response
+    return set_validators(HttpResponse(quiz.content, content_type='application/json', status=status.HTTP_200_OK),
+                          quiz.etag, quiz.last_modified)
+
+
+async def active_quiz_view(request):
+    token = request.GET.get('token', None)
+
+    if not token: return json_response({'error': 'В запросе отсутсвуют обязательные параметры.'},
+                                       status.HTTP_400_BAD_REQUEST)
+    try:
+        since = request.GET.get('since', None)
+        if since is not None: since = int(since)
+    except ValueError:
+        return json_response({'error': 'Проверьте формат'}, status.HTTP_400_BAD_REQUEST)
+    if since is not None and not 0 <= since <= services.sync_token():
+        return json_response({'error': 'Проверьте формат'}, status.HTTP_400_BAD_REQUEST)
+
+    user = await database_sync_to_async(services.check_user)(token)
+    if not user:
+        return json_response({'error': 'Неверный токен пользователя или пользователь не является админом.'},
+                             status.HTTP_401_UNAUTHORIZED)
+    if since is not None:
+        return json_response(await database_sync_to_async(services.get_active_quiz_changes)(user, since),
+                             status.HTTP_200_OK)
+
+    quiz = await database_sync_to_async(services.get_active_quiz)(user)
+    if not quiz: return json_response({'message': 'Активных опросов нет.'}, status.HTTP_204_NO_CONTENT)
+    response = not_modified(request, quiz.etag, quiz.last_modified)
+    if response: return response
+    return set_validators(HttpResponse(quiz.content, content_type='application/json', status=status.HTTP_200_OK),
+                          quiz.etag, quiz.last_modified)
+
+
+async def visitor_history_answer_view(request):
+    token = request.GET.get('token', None)
+
+    if not token: return json_response({'error': 'В запросе отсутсвуют обязательные параметры.'},
+                                       status.HTTP_400_BAD_REQUEST)
+    try:
+        limit = int(request.GET.get('limit', 0))
+        cursor = parse_int(request.GET.get('cursor', 0))
+    except ValueError:
+        return json_response({'error': 'Проверьте формат'}, status.HTTP_400_BAD_REQUEST)
+    if limit < 0 or cursor < 0: return json_response({'error': 'Проверьте формат'}, status.HTTP_400_BAD_REQUEST)
+
+    user = await database_sync_to_async(services.check_user)(token)
+    if not user:
+        return json_response({'error': 'Неверный токен пользователя или пользователь не является админом.'},
+                             status.HTTP_401_UNAUTHORIZED)
+
+    if not limit and not cursor:
+        return json_response(await database_sync_to_async(services.get_history_answers)(user), status.HTTP_200_OK)
+
+    limit = min(limit or HISTORY_MAX_LIMIT, HISTORY_MAX_LIMIT)
+    history_answers = await database_sync_to_async(services.get_history_answers)(user, cursor=cursor, limit=limit)
+    next_cursor = history_answers[-1]['id'] if len(history_answers) == limit else None
+    return json_response({'results': history_answers, 'next_cursor': next_cursor}, status.HTTP_200_OK)
@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, Warning, register
+from django.db import connection
+from django.db.migrations.recorder import MigrationRecorder
+
+from . import search
+
+
+# Кеши, которые живут в памяти одного процесса.
+LOCAL_CACHES = ('django.core.cache.backends.locmem.LocMemCache',)
+
+
+@register()
+def check_snapshot_cache(app_configs, **kwargs):
+    # Версия опроса хранится в кеше: в кеше процесса ее увеличит только процесс, изменивший опрос,
+    # а остальные будут отдавать старый снимок, пока он не истечет.
+    if settings.QUIZ_SNAPSHOT_TIMEOUT is None and settings.CACHES['default']['BACKEND'] in LOCAL_CACHES:
+        return [Error('QUIZ_SNAPSHOT_TIMEOUT=none требует общего кеша для всех процессов.',
+                      hint='Укажите CACHE_URL (memcached, redis) или время жизни снимка в секундах.', id='quiz.E001')]
+    return []
+
+
+@register(Tags.database)
+def check_search_index(app_configs, databases=None, **kwargs):
+    # Запускается с базой: manage.py check --database default, а также перед migrate.
+    if 'default' not in (databases or ()) or connection.vendor != 'sqlite': return []
+    if ('quiz', '0006_search') not in MigrationRecorder(connection).applied_migrations(): return []
+    with connection.cursor() as cursor: missing = search.missing_index_objects(cursor)
+    if not missing: return []
+    return [Warning(f'Нет таблиц или триггеров полнотекстового индекса: {", ".join(missing)}.',
+                    hint='Таблица была пересоздана миграцией. Запустите python manage.py rebuild_search_index.',
+                    id='quiz.W001')]
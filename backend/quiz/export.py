@@ -0,0 +1,54 @@
+import csv
+import json
+from itertools import islice
+
+from .models import UserAnswer
+
+
+EXPORT_FIELDS = ('id', 'visitor_id', 'question_id', 'question', 'answer_text', 'variable_answer_ids', 'variable_answer_text')
+CONTENT_TYPES = {'csv': 'text/csv; charset=utf-8', 'ndjson': 'application/x-ndjson; charset=utf-8'}
+
+
+def iter_answers(quiz_id, chunk_size=500):
+    # Ответы читаются серверным курсором, варианты догружаются на каждую пачку ответов,
+    # поэтому в памяти держится только одна пачка независимо от размера опроса.
+    user_answers = UserAnswer.objects.filter(question__quiz_id=quiz_id).order_by('id').values_list(
+        'id', 'visitor_id', 'question_id', 'question__question', 'answer_text').iterator(chunk_size=chunk_size)
+    through = UserAnswer.variable_answer.through
+
+    while True:
+        chunk = list(islice(user_answers, chunk_size))
+        if not chunk: break
+        variables = {}
+        for user_answer_id, variable_id, text in through.objects.filter(useranswer_id__in=[_[0] for _ in chunk]).order_by(
+                'variableanswer_id').values_list('useranswer_id', 'variableanswer_id', 'variableanswer__text'):
+            variables.setdefault(user_answer_id, []).append((variable_id, text))
+        for row in chunk:
+            row_variables = variables.get(row[0], [])
+            yield row + ([_[0] for _ in row_variables], [_[1] for _ in row_variables])
+
+
+class Echo:
+    # csv.writer пишет строку в "файл" и сразу отдает ее обратно.
+    def write(self, value):
+        return value
+
+
+def export_csv(rows):
+    # Выбранные варианты пишутся JSON-списками: текст варианта может содержать любой разделитель.
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_FIELDS).encode()
+    for row in rows:
+        row = row[:5] + (json.dumps(row[5]), json.dumps(row[6], ensure_ascii=False))
+        yield writer.writerow(row).encode()
+
+
+def export_ndjson(rows):
+    for row in rows:
+        yield (json.dumps(dict(zip(EXPORT_FIELDS, row)), ensure_ascii=False) + '\n').encode()
+
+
+def export_answers(quiz_id, export_format):
+    rows = iter_answers(quiz_id)
+    if export_format == 'csv': return export_csv(rows)
+    return export_ndjson(rows)
@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+from quiz.answer_queue import answer_queue
+from quiz.services import drain_answer_queue
+
+
+class Command(BaseCommand):
+    help = 'Перенести ответы из очереди в базу данных.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--interval', type=float, default=1, help='Пауза в секундах, когда очередь пуста.')
+        parser.add_argument('--drain', action='store_true', help='Разобрать очередь и завершиться.')
+        parser.add_argument('--depth', action='store_true', help='Показать размер очереди и завершиться.')
+        parser.add_argument('--retry-failed', action='store_true',
+                            help='Вернуть в очередь ответы, помеченные ошибкой, перед обработкой.')
+
+    def handle(self, *args, **kwargs):
+        if kwargs['depth']:
+            depth = answer_queue.depth()
+            self.stdout.write(f"В очереди: {depth['pending']}\nС ошибкой: {depth['failed']}")
+            return
+
+        if kwargs['retry_failed']: self.stdout.write(f'Возвращено в очередь: {answer_queue.retry_failed()}')
+
+        total = 0
+        while True:
+            count = drain_answer_queue(kwargs['batch_size'])
+            total += count
+            if count: continue
+            if kwargs['drain']: break
+            time.sleep(kwargs['interval'])
+
+        self.stdout.write(f'Обработано отправок из очереди: {total}')
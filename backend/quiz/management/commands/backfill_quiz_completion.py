@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from quiz.models import QuizCompletion, UserAnswer
+
+
+class Command(BaseCommand):
+    help = 'Заполнить таблицу пройденных опросов по уже записанным ответам пользователей.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **kwargs):
+        batch_size = kwargs['batch_size']
+        pairs = UserAnswer.objects.values_list('visitor_id', 'question__quiz_id').distinct().order_by()
+
+        batch, total = [], 0
+        for visitor_id, quiz_id in pairs.iterator(chunk_size=batch_size):
+            batch.append(QuizCompletion(visitor_id=visitor_id, quiz_id=quiz_id))
+            if len(batch) >= batch_size:
+                QuizCompletion.objects.bulk_create(batch, ignore_conflicts=True)
+                total += len(batch)
+                batch = []
+        if batch:
+            QuizCompletion.objects.bulk_create(batch, ignore_conflicts=True)
+            total += len(batch)
+
+        self.stdout.write(f'Обработано пар пользователь/опрос: {total}')
@@ -0,0 +1,108 @@
+import json
+import math
+import time
+from datetime import datetime
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from quiz import services
+from quiz.models import Quiz, QuizCompletion
+
+
+ENDPOINTS = ('active_quiz', 'quiz', 'active_answer', 'visitor_answers')
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[max(0, math.ceil(len(values) * percent / 100) - 1)]
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Замерить время ответа и число запросов к базе для основных эндпоинтов API.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--endpoints', nargs='*', choices=ENDPOINTS, default=ENDPOINTS)
+        parser.add_argument('--output', help='Сохранить результаты в JSON.')
+        parser.add_argument('--baseline', help='JSON с результатами предыдущего запуска для сравнения.')
+        parser.add_argument('--threshold', type=float, default=1.2,
+                            help='Во сколько раз p95 может вырасти относительно baseline.')
+
+    def handle(self, *args, **kwargs):
+        quiz = Quiz.objects.filter(archived=False, start__lte=datetime.now(), end__gte=datetime.now()).order_by('id').first()
+        completion = QuizCompletion.objects.order_by('id').first()
+        if not quiz or not completion: raise CommandError('Нет данных, сначала запустите seed_load_data.')
+
+        results = {}
+        # Все изменения, сделанные во время замеров, откатываются.
+        try:
+            with transaction.atomic():
+                for endpoint in kwargs['endpoints']:
+                    results[endpoint] = self.measure(endpoint, quiz, completion.visitor_id, kwargs['iterations'])
+                raise Rollback
+        except Rollback:
+            pass
+
+        report = {'created': datetime.now().isoformat(), 'iterations': kwargs['iterations'], 'endpoints': results}
+        for endpoint, result in results.items():
+            self.stdout.write(f"{endpoint:<16} p50 {result['p50']:8.2f} мс  p90 {result['p90']:8.2f} мс  "
+                              f"p95 {result['p95']:8.2f} мс  p99 {result['p99']:8.2f} мс  запросов {result['queries']}")
+        if kwargs['output']:
+            with open(kwargs['output'], 'w') as output: json.dump(report, output, indent=2)
+        if kwargs['baseline']:
+            with open(kwargs['baseline']) as baseline: self.compare(json.load(baseline), report, kwargs['threshold'])
+
+    def measure(self, endpoint, quiz, history_visitor_id, iterations):
+        client = Client()
+        user_model = get_user_model()
+        visitor = user_model.objects.create(username=f'bench_{endpoint}_{time.time_ns()}')
+
+        if endpoint == 'active_answer':
+            user_model.objects.bulk_create([user_model(username=f'bench_answer_{i}_{time.time_ns()}', password='!')
+                                            for i in range(iterations)])
+            tokens = list(user_model.objects.filter(username__startswith='bench_answer_').values_list('id', flat=True))
+            quiz_data = services.get_quiz(quiz.id)
+            answers = json.dumps({'answers': [
+                {'id': _['id'], 'text': 'Ответ'} if _['type_question_id'] == 1 else {'id': _['id'], 'variable': [_['variable_answer'][0]['id']]}
+                for _ in quiz_data['questions']]})
+            request = lambda i: client.post(f'/api/v1/quiz/create_answer/?token={tokens[i]}&quiz={quiz.id}',
+                                            data=answers, content_type='application/json')
+        elif endpoint == 'active_quiz':
+            request = lambda i: client.get(f'/api/v1/quiz/active/?token={visitor.id}')
+        elif endpoint == 'quiz':
+            request = lambda i: client.get(f'/api/v1/quiz/?token={visitor.id}&quiz={quiz.id}')
+        else:
+            request = lambda i: client.get(f'/api/v1/visitor/answers/?token={history_visitor_id}')
+
+        timings, queries = [], []
+        for i in range(iterations):
+            with CaptureQueriesContext(connection) as context:
+                start = time.perf_counter()
+                response = request(i)
+                if response.streaming: b''.join(response.streaming_content)
+                timings.append((time.perf_counter() - start) * 1000)
+            if response.status_code >= 400:
+                raise CommandError(f'{endpoint}: ответ {response.status_code} {response.content[:200]}')
+            queries.append(len(context.captured_queries))
+
+        return {'p50': percentile(timings, 50), 'p90': percentile(timings, 90), 'p95': percentile(timings, 95),
+                'p99': percentile(timings, 99), 'mean': sum(timings) / len(timings), 'queries': max(queries)}
+
+    def compare(self, baseline, report, threshold):
+        regressions = []
+        for endpoint, result in report['endpoints'].items():
+            previous = baseline['endpoints'].get(endpoint)
+            if not previous: continue
+            if result['p95'] > previous['p95'] * threshold:
+                regressions.append(f"{endpoint}: p95 {previous['p95']:.2f} -> {result['p95']:.2f} мс")
+            if result['queries'] > previous['queries']:
+                regressions.append(f"{endpoint}: запросов {previous['queries']} -> {result['queries']}")
+        if regressions: raise CommandError('Регрессия производительности:\n' + '\n'.join(regressions))
+        self.stdout.write('Регрессий относительно baseline нет.')
@@ -0,0 +1,54 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+from django.core.management.base import BaseCommand
+
+from .bench_api import percentile
+
+
+class Command(BaseCommand):
+    help = 'Замерить пропускную способность запущенного сервера при разном числе одновременных запросов. ' \
+           'Запустите один раз против WSGI (gunicorn config.wsgi), другой - против ASGI (uvicorn config.asgi) ' \
+           'и сравните результаты.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help='Например http://127.0.0.1:8000/api/v1/async/quiz/active/?token=1')
+        parser.add_argument('--concurrency', type=int, nargs='*', default=[1, 10, 50, 100])
+        parser.add_argument('--requests', type=int, default=500, help='Запросов на каждый уровень.')
+        parser.add_argument('--timeout', type=float, default=30)
+        parser.add_argument('--output', help='Сохранить результаты в JSON.')
+
+    def handle(self, *args, **kwargs):
+        url, timeout = kwargs['url'], kwargs['timeout']
+
+        def request(_):
+            start = time.perf_counter()
+            try:
+                with urlopen(url, timeout=timeout) as response: response.read()
+                ok = True
+            except (HTTPError, OSError):
+                ok = False
+            return (time.perf_counter() - start) * 1000, ok
+
+        results = []
+        for concurrency in kwargs['concurrency']:
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                responses = list(executor.map(request, range(kwargs['requests'])))
+            elapsed = time.perf_counter() - start
+            timings = [timing for timing, ok in responses if ok]
+            result = {'concurrency': concurrency, 'rps': len(timings) / elapsed,
+                      'errors': len(responses) - len(timings),
+                      'p50': percentile(timings, 50) if timings else None,
+                      'p95': percentile(timings, 95) if timings else None,
+                      'p99': percentile(timings, 99) if timings else None}
+            results.append(result)
+            self.stdout.write(f"{concurrency:>5} одновременно: {result['rps']:8.1f} запросов/с, "
+                              f"p50 {result['p50'] or 0:8.2f} мс, p95 {result['p95'] or 0:8.2f} мс, "
+                              f"p99 {result['p99'] or 0:8.2f} мс, ошибок {result['errors']}")
+
+        if kwargs['output']:
+            with open(kwargs['output'], 'w') as output: json.dump({'url': url, 'results': results}, output, indent=2)
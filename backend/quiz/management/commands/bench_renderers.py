@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from quiz.models import Quiz
+from quiz.renderers import MessagePackRenderer, ORJSONRenderer, msgpack, orjson
+from quiz.serializers import QuizSerializer, prefetch_quiz
+
+
+class Command(BaseCommand):
+    help = 'Сравнить время кодирования и размер ответа QuizSerializer для JSONRenderer DRF, orjson и MessagePack. ' \
+           'Данные можно подготовить через seed_load_data.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--quizzes', type=int, default=10, help='Сколько опросов сериализовать в один ответ.')
+        parser.add_argument('--iterations', type=int, default=200)
+
+    def handle(self, *args, **kwargs):
+        quizzes = list(prefetch_quiz(Quiz.objects.order_by('id'))[:kwargs['quizzes']])
+        if not quizzes: raise CommandError('В базе нет опросов, запустите seed_load_data.')
+        data = QuizSerializer(quizzes, many=True).data
+
+        renderers = [('drf json', JSONRenderer())]
+        if orjson: renderers.append(('orjson', ORJSONRenderer()))
+        else: self.stdout.write('orjson не установлен, пропускаем.')
+        if msgpack: renderers.append(('msgpack', MessagePackRenderer()))
+        else: self.stdout.write('msgpack не установлен, пропускаем.')
+
+        self.stdout.write(f'Опросов: {len(quizzes)}, итераций: {kwargs["iterations"]}')
+        baseline = None
+        for name, renderer in renderers:
+            start = time.perf_counter()
+            for _ in range(kwargs['iterations']): content = renderer.render(data)
+            elapsed = (time.perf_counter() - start) * 1000 / kwargs['iterations']
+            baseline = baseline or elapsed
+            self.stdout.write(f'{name:>10}: {elapsed:8.3f} мс, x{baseline / elapsed:5.2f}, {len(content):>9} байт')
@@ -0,0 +1,52 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from quiz import rows
+from quiz.models import Quiz, QuizCompletion, UserAnswer
+from quiz.serializers import HistoryAnswersSerializer, QuizHistorySerializer, QuizSerializer, prefetch_quiz
+
+
+class Command(BaseCommand):
+    help = 'Сравнить сериализаторы DRF с облегченной сериализацией quiz/rows.py: время вместе с запросами к базе ' \
+           'и совпадение результата. Данные можно подготовить через seed_load_data.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--quizzes', type=int, default=10, help='Сколько опросов сериализовать за раз.')
+        parser.add_argument('--iterations', type=int, default=50)
+
+    def handle(self, *args, **kwargs):
+        quiz_ids = list(Quiz.objects.order_by('id').values_list('id', flat=True)[:kwargs['quizzes']])
+        if not quiz_ids: raise CommandError('В базе нет опросов, запустите seed_load_data.')
+        queryset = Quiz.objects.filter(id__in=quiz_ids)
+        completion = QuizCompletion.objects.order_by('-id').first()
+        visitor = completion and get_user_model().objects.get(id=completion.visitor_id)
+
+        def drf_history():
+            quizzes = Quiz.objects.filter(quizcompletion__visitor=visitor).order_by('id')
+            answers = UserAnswer.objects.filter(visitor=visitor).select_related('question').prefetch_related(
+                'variable_answer').order_by('id')
+            data = QuizHistorySerializer(quizzes, many=True).data
+            for quiz in data:
+                quiz['answers'] = HistoryAnswersSerializer([_ for _ in answers if _.question.quiz_id == quiz['id']],
+                                                           many=True).data
+            return data
+
+        cases = [('quiz', lambda: QuizSerializer(prefetch_quiz(queryset), many=True).data,
+                  lambda: [rows.quiz_data(quiz) for quiz in rows.load_quizzes(queryset)])]
+        if visitor: cases.append(('history', drf_history, lambda: rows.history_answers(visitor)))
+        else: self.stdout.write('Нет пройденных опросов, история пропускается.')
+
+        render = JSONRenderer().render
+        self.stdout.write(f'Опросов: {len(quiz_ids)}, итераций: {kwargs["iterations"]}')
+        for name, drf, light in cases:
+            if render(drf()) != render(light()): raise CommandError(f'{name}: результаты не совпадают.')
+            timings = []
+            for serialize in (drf, light):
+                start = time.perf_counter()
+                for _ in range(kwargs['iterations']): serialize()
+                timings.append((time.perf_counter() - start) * 1000 / kwargs['iterations'])
+            self.stdout.write(f'{name:>8}: drf {timings[0]:8.3f} мс, rows {timings[1]:8.3f} мс, '
+                              f'x{timings[0] / timings[1]:5.2f}')
@@ -1,5 +1,13 @@
-from django.core.management.base import BaseCommand
+import csv
+import os
+import secrets
+from concurrent.futures import ProcessPoolExecutor
+
+import django
 from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
 
 from faker import Faker
 
@@ -7,12 +15,77 @@ from faker import Faker
 fake = Faker()
 
 
+def hash_passwords(passwords):
+    return [make_password(_) for _ in passwords]
+
+
 class Command(BaseCommand):
-    help = 'Наполнить базу данных, базовыми типами вопросов.'
+    help = 'Создать пользователей-посетителей.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=1)
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Процессов для хеширования паролей, 0 - без пула.')
+        parser.add_argument('--hash-batch', type=int, default=16,
+                            help='Паролей в одной задаче пула: мелкие задачи загружают все процессы.')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Пользователей в одном bulk_create.')
+        parser.add_argument('--output', help='CSV с id, username и паролем, по умолчанию stdout.')
 
     def handle(self, *args, **kwargs):
-        profile = fake.simple_profile()
-        user = get_user_model().objects.create(username=profile['username'], is_superuser=0)
-        user.set_password(profile['username'])
-        self.stdout.write(f"username: {user}\nid: {user.id}")
+        count, hash_batch = kwargs['count'], kwargs['hash_batch']
+        credentials = self.generate_credentials(count, kwargs['chunk_size'])
+        passwords = [password for _, password in credentials]
+        batches = [passwords[i:i + hash_batch] for i in range(0, count, hash_batch)]
+
+        # Хеширование пароля (PBKDF2) - основная работа, раскидываем его по процессам.
+        if kwargs['workers'] and kwargs['workers'] > 1 and len(batches) > 1:
+            with ProcessPoolExecutor(max_workers=kwargs['workers'], initializer=django.setup) as executor:
+                hashed = [password for batch in executor.map(hash_passwords, batches) for password in batch]
+        else:
+            hashed = [password for batch in map(hash_passwords, batches) for password in batch]
+
+        try:
+            rows = self.create_users(credentials, hashed, kwargs['chunk_size'])
+        except IntegrityError:
+            # Все пользователи пишутся в одной транзакции: при ошибке не остается созданных, но не выведенных.
+            raise CommandError('Имя пользователя занято другим процессом, пользователи не созданы. Повторите запуск.')
+
+        if count == 1 and not kwargs['output']:
+            user_id, username, password = rows[0]
+            self.stdout.write(f"username: {username}\npassword: {password}\nid: {user_id}")
+            return
+
+        output = open(kwargs['output'], 'w', newline='') if kwargs['output'] else self.stdout
+        try:
+            writer = csv.writer(output)
+            writer.writerow(('id', 'username', 'password'))
+            writer.writerows(rows)
+        finally:
+            if kwargs['output']: output.close()
+
+    @staticmethod
+    def generate_credentials(count, chunk_size):
+        # Имена уникальны и внутри запуска, и среди уже существующих пользователей.
+        user_model = get_user_model()
+        usernames = set()
+        while len(usernames) < count:
+            candidates = list({f'{fake.user_name()}_{secrets.token_hex(3)}' for _ in range(count - len(usernames))}
+                              - usernames)
+            for i in range(0, len(candidates), chunk_size):
+                chunk = candidates[i:i + chunk_size]
+                usernames.update(set(chunk) - set(user_model.objects.filter(username__in=chunk)
+                                                  .values_list('username', flat=True)))
+        return [(username, secrets.token_urlsafe(9)) for username in usernames]
 
+    @staticmethod
+    def create_users(credentials, hashed, chunk_size):
+        user_model = get_user_model()
+        rows = []
+        with transaction.atomic():
+            for i in range(0, len(credentials), chunk_size):
+                chunk = credentials[i:i + chunk_size]
+                user_model.objects.bulk_create([user_model(username=username, password=password, is_superuser=False)
+                                                for (username, _), password in zip(chunk, hashed[i:i + chunk_size])])
+                ids = dict(user_model.objects.filter(username__in=[_[0] for _ in chunk]).values_list('username', 'id'))
+                rows += [(ids[username], username, password) for username, password in chunk]
+        return rows
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from quiz.export import CONTENT_TYPES, export_answers
+
+
+class Command(BaseCommand):
+    help = 'Выгрузить все ответы на опрос в CSV или NDJSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--quiz', type=int, required=True)
+        parser.add_argument('--format', choices=tuple(CONTENT_TYPES), default='csv')
+        parser.add_argument('--output', help='Файл для выгрузки, по умолчанию stdout.')
+
+    def handle(self, *args, **kwargs):
+        rows = export_answers(kwargs['quiz'], kwargs['format'])
+        if not kwargs['output']:
+            for chunk in rows: self.stdout.write(chunk.decode(), ending='')
+            return
+
+        with open(kwargs['output'], 'wb') as output:
+            for chunk in rows: output.write(chunk)
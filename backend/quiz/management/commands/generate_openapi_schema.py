@@ -0,0 +1,19 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from config.schema import encode_schema, generate_schema
+
+
+class Command(BaseCommand):
+    help = 'Собрать OpenAPI-схему в файл, который отдает /swagger/. Запускать при сборке или деплое.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=settings.OPENAPI_SCHEMA_PATH)
+
+    def handle(self, *args, **kwargs):
+        output = kwargs['output']
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, 'wb') as schema_file: schema_file.write(encode_schema(generate_schema()))
+        self.stdout.write(f'Схема записана в {output}')
@@ -0,0 +1,52 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from quiz import analytics
+
+
+class Command(BaseCommand):
+    help = 'Отчеты по ответам на опрос: распределение, таблица сопряженности, совместный выбор вариантов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--quiz', type=int)
+        parser.add_argument('--kind', choices=('distribution', 'crosstab', 'cooccurrence'), default='distribution')
+        parser.add_argument('--question-a', type=int)
+        parser.add_argument('--question-b', type=int)
+        parser.add_argument('--benchmark', action='store_true', help='Замерить расчеты на синтетических данных.')
+        parser.add_argument('--answers', type=int, default=1000000, help='Число выбранных вариантов для --benchmark.')
+        parser.add_argument('--visitors', type=int, default=200000)
+        parser.add_argument('--questions', type=int, default=20)
+        parser.add_argument('--options', type=int, default=5, help='Вариантов в каждом вопросе.')
+
+    def handle(self, *args, **kwargs):
+        if analytics.np is None: raise CommandError('Для аналитики должен быть установлен numpy.')
+        if kwargs['benchmark']: return self.benchmark(**kwargs)
+        if not kwargs['quiz']: raise CommandError('Укажите --quiz.')
+        if kwargs['kind'] == 'crosstab' and (not kwargs['question_a'] or not kwargs['question_b']):
+            raise CommandError('Для crosstab укажите --question-a и --question-b.')
+
+        data = analytics.quiz_analytics(kwargs['quiz'], kwargs['kind'], kwargs['question_a'], kwargs['question_b'])
+        self.stdout.write(json.dumps(data, ensure_ascii=False))
+
+    def benchmark(self, answers, visitors, questions, options, **kwargs):
+        np = analytics.np
+        rng = np.random.default_rng(0)
+        option_ids = np.arange(1, questions * options + 1)
+        option_questions = np.repeat(np.arange(1, questions + 1), options)
+        pairs = np.column_stack((rng.integers(1, visitors + 1, answers), rng.choice(option_ids, answers)))
+
+        timings = {}
+        start = time.perf_counter()
+        matrix = analytics.QuizMatrix.from_pairs(pairs, option_ids, option_questions)
+        timings['matrix'] = time.perf_counter() - start
+        for name, report in (('distribution', matrix.distribution),
+                             ('crosstab', lambda: matrix.crosstab(1, 2)),
+                             ('cooccurrence', matrix.cooccurrence)):
+            start = time.perf_counter()
+            report()
+            timings[name] = time.perf_counter() - start
+
+        self.stdout.write(f'Ответов: {answers}, пользователей: {matrix.respondents}, вариантов: {len(option_ids)}, '
+                          f'матрица: {matrix.matrix.nbytes / 2 ** 20:.1f} МБ')
+        for name, seconds in timings.items(): self.stdout.write(f'{name:<14}{seconds * 1000:10.1f} мс')
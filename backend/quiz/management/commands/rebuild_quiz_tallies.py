@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from quiz.services import rebuild_tallies
+
+
+class Command(BaseCommand):
+    help = 'Пересчитать статистику ответов по таблице visitor_answers.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--quiz', type=int, nargs='*', help='id опросов, по умолчанию все.')
+
+    def handle(self, *args, **kwargs):
+        rebuild_tallies(kwargs['quiz'])
+        self.stdout.write('Статистика пересчитана.')
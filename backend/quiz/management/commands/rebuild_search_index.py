@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from quiz import search
+
+
+class Command(BaseCommand):
+    help = 'Пересоздать полнотекстовый индекс (SQLite, FTS5) и его триггеры. Нужен после миграций, ' \
+           'которые пересоздают таблицы questions или visitor_answers (проверка quiz.W001).'
+
+    def handle(self, *args, **kwargs):
+        if connection.vendor != 'sqlite':
+            self.stdout.write('Индекс нужен только для SQLite, на других базах поиск работает через icontains.')
+            return
+        search.rebuild_index()
+        self.stdout.write('Индекс поиска пересоздан.')
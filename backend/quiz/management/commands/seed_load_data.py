@@ -0,0 +1,64 @@
+import random
+from datetime import datetime, timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from quiz import services
+from quiz.models import Question, Quiz, QuizCompletion, TypeQuestion
+
+
+class Command(BaseCommand):
+    help = 'Наполнить базу опросами, пользователями и ответами для нагрузочного тестирования.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--quizzes', type=int, default=10)
+        parser.add_argument('--questions', type=int, default=20, help='Вопросов в каждом опросе.')
+        parser.add_argument('--options', type=int, default=4, help='Вариантов в каждом вопросе с выбором.')
+        parser.add_argument('--visitors', type=int, default=1000)
+        parser.add_argument('--answer-rate', type=float, default=0.5, help='Доля опросов, пройденных пользователем.')
+        parser.add_argument('--prefix', default='load', help='Префикс имен создаваемых пользователей.')
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **kwargs):
+        rng = random.Random(kwargs['seed'])
+        prefix = kwargs['prefix']
+        for type_question_id, name in ((1, 'Ответ текстом'), (2, 'Выбрать ответ'), (3, 'Выбрать несколько вариантов')):
+            TypeQuestion.objects.get_or_create(id=type_question_id, defaults={'name': name})
+
+        user_model = get_user_model()
+        author, _ = user_model.objects.get_or_create(username=f'{prefix}_author', defaults={'is_superuser': True})
+        user_model.objects.bulk_create([user_model(username=f'{prefix}_visitor_{i}', password='!')
+                                        for i in range(kwargs['visitors'])], ignore_conflicts=True)
+        visitor_ids = list(user_model.objects.filter(username__startswith=f'{prefix}_visitor_').values_list('id', flat=True))
+
+        options = [f'Вариант {i}' for i in range(kwargs['options'])]
+        for i in range(kwargs['quizzes']):
+            quiz = Quiz.objects.create(name=f'Нагрузочный опрос {i}', description='Сгенерирован seed_load_data',
+                                       start=datetime.now() - timedelta(days=1), end=datetime.now() + timedelta(days=30),
+                                       author=author)
+            services.create_questions(quiz.id, [{'text': f'Вопрос {j}', 'type_question': j % 3 + 1, 'variable_answer': options}
+                                                for j in range(kwargs['questions'])], author)
+            quiz_question = {_.id: _ for _ in Question.objects.filter(quiz=quiz).prefetch_related('variableanswer_set')}
+
+            respondents = [_ for _ in visitor_ids if rng.random() < kwargs['answer_rate']]
+            for start in range(0, len(respondents), kwargs['batch_size']):
+                batch = respondents[start:start + kwargs['batch_size']]
+                with transaction.atomic():
+                    QuizCompletion.objects.bulk_create([QuizCompletion(visitor_id=_, quiz=quiz) for _ in batch])
+                    services.save_answers([(visitor_id, self.random_answers(rng, quiz_question), quiz_question)
+                                           for visitor_id in batch])
+            self.stdout.write(f'Опрос {quiz.id}: ответов от {len(respondents)} пользователей')
+
+        self.stdout.write(f'Автор: {author.id}\nПользователей: {len(visitor_ids)}')
+
+    @staticmethod
+    def random_answers(rng, quiz_question):
+        answers = []
+        for question in quiz_question.values():
+            variables = [_.id for _ in question.variableanswer_set.all()]
+            if question.type_question_id == 1: answers.append({'id': question.id, 'text': f'Ответ {rng.random():.6f}'})
+            elif question.type_question_id == 2: answers.append({'id': question.id, 'variable': [rng.choice(variables)]})
+            else: answers.append({'id': question.id, 'variable': rng.sample(variables, rng.randint(1, len(variables)))})
+        return answers
@@ -0,0 +1,67 @@
+import threading
+from bisect import bisect_left
+
+
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name, labels):
+        lines, total = [], 0
+        for bucket, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            lines.append(f'{name}_bucket{{{labels},le="{bucket}"}} {total}')
+        lines.append(f'{name}_sum{{{labels}}} {self.sum}')
+        lines.append(f'{name}_count{{{labels}}} {self.count}')
+        return lines
+
+
+class Metrics:
+    # Гистограммы по имени url, в памяти процесса.
+    histograms = (
+        ('quiz_request_duration_seconds', 'Время обработки запроса.', TIME_BUCKETS),
+        ('quiz_request_db_duration_seconds', 'Время запросов к базе данных.', TIME_BUCKETS),
+        ('quiz_request_queries', 'Число запросов к базе данных.', QUERY_BUCKETS),
+    )
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def observe(self, url_name, method, duration, db_duration, queries):
+        with self._lock:
+            view = self._views.get((url_name, method))
+            if view is None:
+                view = self._views[(url_name, method)] = [Histogram(buckets) for _, _, buckets in self.histograms]
+            for histogram, value in zip(view, (duration, db_duration, queries)): histogram.observe(value)
+
+    def clear(self):
+        with self._lock:
+            self._views.clear()
+
+    def render(self, values=()):
+        # values - дополнительные метрики: (имя, тип, описание, значение).
+        lines = []
+        with self._lock:
+            for i, (name, description, _) in enumerate(self.histograms):
+                lines += [f'# HELP {name} {description}', f'# TYPE {name} histogram']
+                for (url_name, method), view in sorted(self._views.items()):
+                    lines += view[i].render(name, f'view="{url_name}",method="{method}"')
+        for name, metric_type, description, value in values:
+            lines += [f'# HELP {name} {description}', f'# TYPE {name} {metric_type}', f'{name} {value}']
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
@@ -0,0 +1,100 @@
+import asyncio
+import logging
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+
+from .metrics import metrics
+
+
+logger = logging.getLogger(__name__)
+
+# Запросы к базе текущего HTTP-запроса: (sql, секунды). ContextVar копируется в потоки sync_to_async,
+# поэтому запросы из асинхронных представлений тоже попадают в список своего HTTP-запроса.
+request_queries = ContextVar('request_queries', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    queries = request_queries.get()
+    if queries is None: return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        queries.append((sql, time.perf_counter() - start))
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    # Подключается к connection_created (quiz/apps.py): обертка ставится на соединение в любом потоке,
+    # а не только в потоке, где идет запрос. Ставим ее первой: соединение может открыться внутри
+    # connection.execute_wrapper(), который на выходе снимает последнюю обертку списка.
+    if record_query not in connection.execute_wrappers: connection.execute_wrappers.insert(0, record_query)
+
+
+class MetricsMiddleware:
+    # Время запроса, время и число запросов к базе по имени url.
+    # Медленные запросы пишутся в лог вместе с SQL. Для потоковых ответов (история stream=1, выгрузка)
+    # метрики пишутся после отдачи последней части.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # Как MiddlewareMixin: под ASGI цепочка остается асинхронной, без перехода в поток.
+        if asyncio.iscoroutinefunction(self.get_response): self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        queries, start = [], time.perf_counter()
+        token = request_queries.set(queries)
+        try:
+            response = self.get_response(request)
+        finally:
+            request_queries.reset(token)
+        # В Django 3.1.0 SecurityMiddleware не помечается асинхронной (не вызывает MiddlewareMixin.__init__),
+        # поэтому асинхронный режим определяем по результату, а не только по get_response.
+        if asyncio.iscoroutine(response): return self.finish_async(request, response, queries, start)
+        return self.finish(request, response, queries, start)
+
+    async def finish_async(self, request, response, queries, start):
+        token = request_queries.set(queries)
+        try:
+            response = await response
+        finally:
+            request_queries.reset(token)
+        return self.finish(request, response, queries, start)
+
+    def finish(self, request, response, queries, start):
+        url_name = request.resolver_match.url_name if request.resolver_match else None
+        if not url_name or url_name == 'metrics': return response
+
+        if response.streaming:
+            response.streaming_content = self.stream(response.streaming_content, request, url_name, queries, start)
+        else:
+            self.observe(request, url_name, queries, start)
+        return response
+
+    def stream(self, content, request, url_name, queries, start):
+        # Генератор выполняется уже после выхода из middleware, список запросов подставляется на каждую часть.
+        content = iter(content)
+        try:
+            while True:
+                token = request_queries.set(queries)
+                try:
+                    chunk = next(content)
+                except StopIteration:
+                    return
+                finally:
+                    request_queries.reset(token)
+                yield chunk
+        finally:
+            self.observe(request, url_name, queries, start)
+
+    @staticmethod
+    def observe(request, url_name, queries, start):
+        duration = time.perf_counter() - start
+        metrics.observe(url_name, request.method, duration, sum(_[1] for _ in queries), len(queries))
+        if duration > settings.SLOW_REQUEST_THRESHOLD:
+            logger.warning('Медленный запрос %s %s: %.3f с, запросов к базе: %d\n%s', request.method,
+                           request.get_full_path(), duration, len(queries),
+                           '\n'.join(f'{seconds:.4f} {sql}' for sql, seconds in queries))
@@ -0,0 +1,32 @@
+# Generated by Django 3.1 on 2026-10-18 11:40
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('quiz', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuizCompletion',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('quiz', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='quiz.quiz')),
+                ('visitor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'quiz_completion',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='quizcompletion',
+            constraint=models.UniqueConstraint(fields=('visitor', 'quiz'), name='quiz_completion_visitor_quiz_uniq'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 3.1 on 2026-10-18 11:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0002_quiz_completion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VariableAnswerTally',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('count', models.IntegerField(default=0)),
+                ('quiz', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='quiz.quiz')),
+                ('variable_answer', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='tally', to='quiz.variableanswer')),
+            ],
+            options={
+                'db_table': 'variable_answer_tally',
+            },
+        ),
+        migrations.CreateModel(
+            name='QuizTally',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('responses', models.IntegerField(default=0)),
+                ('quiz', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='tally', to='quiz.quiz')),
+            ],
+            options={
+                'db_table': 'quiz_tally',
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.1 on 2026-10-18 11:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0003_tallies'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quiz',
+            name='modified',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='quiz',
+            name='version',
+            field=models.IntegerField(default=1),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 3.1 on 2026-10-18 11:58
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.db.models.expressions
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('quiz', '0004_quiz_version'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['quiz', 'archived', 'position'], name='questions_quiz_archived_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(condition=models.Q(archived=False), fields=['quiz', 'position'], name='questions_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='quiz',
+            index=models.Index(fields=['archived', 'start', 'end'], name='quiz_archived_period_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='quiz',
+            index=models.Index(condition=models.Q(archived=False), fields=['start', 'end'], name='quiz_active_period_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='useranswer',
+            index=models.Index(fields=['visitor', 'question'], name='visitor_answers_visitor_q_idx'),
+        ),
+        # Индексы внешних ключей удаляются после создания составных: MySQL не дает удалить
+        # единственный индекс, на который опирается внешний ключ.
+        migrations.AlterField(
+            model_name='question',
+            name='quiz',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='quiz.quiz'),
+        ),
+        migrations.AlterField(
+            model_name='useranswer',
+            name='visitor',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddConstraint(
+            model_name='quiz',
+            constraint=models.CheckConstraint(check=models.Q(end__gte=django.db.models.expressions.F('start')), name='quiz_end_after_start'),
+        ),
+    ]
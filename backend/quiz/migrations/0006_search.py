@@ -0,0 +1,57 @@
+from django.db import migrations
+
+
+# Полнотекстовый индекс FTS5 только для SQLite, на других базах поиск работает через icontains.
+# Таблицы без содержимого (content=''): хранится только инвертированный индекс, rowid - id записи.
+# unicode61 не считает "ё" буквой с диакритикой, поэтому ё -> е заменяем сами, так же делает quiz/search.py.
+# SQLite пересоздает таблицу при изменении столбцов, вместе с ней пропадают триггеры: миграция,
+# меняющая questions или visitor_answers, должна создать их заново (quiz.search.rebuild_index).
+# Пропавшие триггеры находит проверка quiz.W001 и тест test_search_index.
+# SQL миграции зафиксирован здесь, текущая версия - в quiz/search.py.
+TABLES = (
+    ('question_search', 'questions', 'question'),
+    ('answer_search', 'visitor_answers', 'answer_text'),
+)
+
+
+def fold(value):
+    return f"replace(replace({value}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite': return
+
+    for search_table, table, column in TABLES:
+        schema_editor.execute(f"CREATE VIRTUAL TABLE {search_table} USING fts5({column}, content='', "
+                              f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')")
+        # Пустые значения в индекс не попадают, удаление и вставка при изменении идут строго по порядку.
+        delete = f"INSERT INTO {search_table}({search_table}, rowid, {column}) " \
+                 f"SELECT 'delete', old.id, {fold(f'old.{column}')} WHERE old.{column} IS NOT NULL;"
+        insert = f"INSERT INTO {search_table}(rowid, {column}) " \
+                 f"SELECT new.id, {fold(f'new.{column}')} WHERE new.{column} IS NOT NULL;"
+        schema_editor.execute(f'CREATE TRIGGER {search_table}_insert AFTER INSERT ON {table} BEGIN {insert} END')
+        schema_editor.execute(f'CREATE TRIGGER {search_table}_delete AFTER DELETE ON {table} BEGIN {delete} END')
+        schema_editor.execute(f'CREATE TRIGGER {search_table}_update AFTER UPDATE OF {column} ON {table} '
+                              f'BEGIN {delete} {insert} END')
+        schema_editor.execute(f"INSERT INTO {search_table}(rowid, {column}) "
+                              f"SELECT id, {fold(column)} FROM {table} WHERE {column} IS NOT NULL")
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite': return
+
+    for search_table, _, _ in TABLES:
+        for trigger in ('insert', 'delete', 'update'):
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS {search_table}_{trigger}')
+        schema_editor.execute(f'DROP TABLE IF EXISTS {search_table}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0005_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
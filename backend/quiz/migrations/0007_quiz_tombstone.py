@@ -0,0 +1,24 @@
+# Generated by Django 3.1 on 2026-10-18 12:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quiz', '0006_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuizTombstone',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('quiz_id', models.IntegerField()),
+                ('deleted', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'db_table': 'quiz_tombstone',
+            },
+        ),
+    ]
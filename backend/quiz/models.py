@@ -11,12 +11,24 @@ class Quiz(models.Model):
     end = models.DateTimeField()
     archived = models.BooleanField(null=True, default=False)
     author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    # Растет при любом изменении опроса, его вопросов и вариантов ответа (ETag).
+    version = models.IntegerField(default=1)
+    modified = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
 
     class Meta:
         db_table = 'quiz'
+        # Частичные индексы (condition) создаются только там, где база их поддерживает (SQLite, PostgreSQL),
+        # на MySQL работают составные.
+        indexes = [
+            models.Index(fields=('archived', 'start', 'end'), name='quiz_archived_period_idx'),
+            models.Index(fields=('start', 'end'), condition=models.Q(archived=False), name='quiz_active_period_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(check=models.Q(end__gte=models.F('start')), name='quiz_end_after_start'),
+        ]
 
 
 class TypeQuestion(models.Model):
@@ -32,7 +44,8 @@ class TypeQuestion(models.Model):
 
 class Question(models.Model):
     id = models.AutoField(primary_key=True)
-    quiz = models.ForeignKey('Quiz', on_delete=models.CASCADE)
+    # Отдельный индекс по quiz_id не нужен, его заменяет questions_quiz_archived_idx.
+    quiz = models.ForeignKey('Quiz', on_delete=models.CASCADE, db_index=False)
     question = models.CharField(max_length=4000)
     position = models.IntegerField()
     archived = models.BooleanField(null=True, default=False)
@@ -45,6 +58,10 @@ class Question(models.Model):
     class Meta:
         db_table = 'questions'
         ordering = ('position',)
+        indexes = [
+            models.Index(fields=('quiz', 'archived', 'position'), name='questions_quiz_archived_idx'),
+            models.Index(fields=('quiz', 'position'), condition=models.Q(archived=False), name='questions_active_idx'),
+        ]
 
 
 class VariableAnswer(models.Model):
@@ -61,7 +78,8 @@ class VariableAnswer(models.Model):
 
 class UserAnswer(models.Model):
     id = models.AutoField(primary_key=True)
-    visitor = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    # Отдельный индекс по visitor_id не нужен, его заменяет visitor_answers_visitor_q_idx.
+    visitor = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, db_index=False)
     answer_text = models.CharField(max_length=1000, blank=True, null=True, default=None)
     created = models.DateTimeField(auto_now_add=True)
     question = models.ForeignKey('Question', on_delete=models.CASCADE)
@@ -69,3 +87,49 @@ class UserAnswer(models.Model):
 
     class Meta:
         db_table = 'visitor_answers'
+        indexes = [
+            models.Index(fields=('visitor', 'question'), name='visitor_answers_visitor_q_idx'),
+        ]
+
+
+class QuizCompletion(models.Model):
+    id = models.AutoField(primary_key=True)
+    visitor = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    quiz = models.ForeignKey('Quiz', on_delete=models.CASCADE)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'quiz_completion'
+        constraints = [
+            models.UniqueConstraint(fields=('visitor', 'quiz'), name='quiz_completion_visitor_quiz_uniq'),
+        ]
+
+
+class QuizTombstone(models.Model):
+    # Удаленные опросы (в том числе каскадом вместе с автором): строки опроса уже нет,
+    # а клиенты дельта-синхронизации должны получить его id в removed.
+    id = models.AutoField(primary_key=True)
+    quiz_id = models.IntegerField()
+    deleted = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        db_table = 'quiz_tombstone'
+
+
+class QuizTally(models.Model):
+    id = models.AutoField(primary_key=True)
+    quiz = models.OneToOneField('Quiz', on_delete=models.CASCADE, related_name='tally')
+    responses = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'quiz_tally'
+
+
+class VariableAnswerTally(models.Model):
+    id = models.AutoField(primary_key=True)
+    quiz = models.ForeignKey('Quiz', on_delete=models.CASCADE)
+    variable_answer = models.OneToOneField('VariableAnswer', on_delete=models.CASCADE, related_name='tally')
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'variable_answer_tally'
@@ -0,0 +1,36 @@
+import threading
+
+from .models import TypeQuestion
+
+
+class TypeQuestionRegistry:
+    # В таблице type_question всего несколько строк (см. generate_type_question),
+    # поэтому читаем ее один раз и дальше отдаем типы из памяти.
+    def __init__(self):
+        self._types = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        with self._lock:
+            if self._types is not None: return self._types
+            types = {_.id: _ for _ in TypeQuestion.objects.all()}
+            # Пустую таблицу не запоминаем: типы могут появиться позже без сигналов (миграции, bulk_create, сырой SQL),
+            # и до перезапуска все вопросы не проходили бы проверку.
+            if types: self._types = types
+            return types
+
+    def get(self, type_question_id):
+        types = self._types if self._types is not None else self.load()
+        if not isinstance(type_question_id, int): return None
+        return types.get(type_question_id)
+
+    def clear(self):
+        with self._lock:
+            self._types = None
+
+
+type_question_registry = TypeQuestionRegistry()
+
+
+def invalidate_type_questions(sender, **kwargs):
+    type_question_registry.clear()
@@ -0,0 +1,52 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+# Реплика, на которую идут чтения в текущем контексте, None - основная база.
+_replica = ContextVar('replica', default=None)
+
+
+def sticky_key(visitor_id):
+    return f'db:primary:{visitor_id}'
+
+
+def pin_primary(visitor_id):
+    # После записи ответов пользователь какое-то время читает с основной базы: реплика может отставать.
+    if settings.DATABASE_REPLICAS:
+        cache.set(sticky_key(visitor_id), 1, settings.DATABASE_REPLICA_STICKY_TIMEOUT)
+
+
+@contextmanager
+def replica_reads(visitor_id=None):
+    # Чтения внутри блока идут на реплику. Пользователь всегда попадает на одну и ту же реплику,
+    # чтобы соседние запросы не видели разное отставание, остальные распределяются случайно.
+    replicas, alias = settings.DATABASE_REPLICAS, None
+    if replicas and not (visitor_id and cache.get(sticky_key(visitor_id))):
+        alias = replicas[visitor_id % len(replicas)] if visitor_id else random.choice(replicas)
+    token = _replica.set(alias)
+    try:
+        yield alias
+    finally:
+        _replica.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        alias = _replica.get()
+        # Внутри транзакции читаем с основной базы то, что только что записали.
+        if alias and not connections[DEFAULT_DB_ALIAS].in_atomic_block: return alias
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
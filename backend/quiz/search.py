@@ -0,0 +1,135 @@
+import re
+
+from django.db import connection, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Replace
+
+from .models import Question, UserAnswer
+
+
+SCOPES = ('questions', 'answers')
+WORD = re.compile(r'\w+')
+
+# Индексы question_search и answer_search создает миграция 0006_search (только SQLite, FTS5),
+# пересоздает manage.py rebuild_search_index.
+# bm25 тем меньше, чем лучше совпадение.
+QUESTIONS_SQL = '''
+    SELECT q.id, q.quiz_id, q.question, q.archived, bm25(question_search) AS rank
+    FROM question_search
+    JOIN questions q ON q.id = question_search.rowid
+    JOIN quiz ON quiz.id = q.quiz_id
+    WHERE question_search MATCH %s AND quiz.author_id = %s
+    ORDER BY rank, q.id
+    LIMIT %s OFFSET %s
+'''
+ANSWERS_SQL = '''
+    SELECT a.id, q.quiz_id, a.question_id, q.question, a.visitor_id, a.answer_text, bm25(answer_search) AS rank
+    FROM answer_search
+    JOIN visitor_answers a ON a.id = answer_search.rowid
+    JOIN questions q ON q.id = a.question_id
+    JOIN quiz ON quiz.id = q.quiz_id
+    WHERE answer_search MATCH %s AND quiz.author_id = %s
+    ORDER BY rank, a.id
+    LIMIT %s OFFSET %s
+'''
+QUESTION_FIELDS = ('id', 'quiz', 'question', 'archived', 'rank')
+ANSWER_FIELDS = ('id', 'quiz', 'question_id', 'question', 'visitor_id', 'answer_text', 'rank')
+
+
+# Индекс FTS5 для SQLite: (таблица индекса, таблица, колонка). Создается миграцией 0006_search.
+INDEX_TABLES = (
+    ('question_search', 'questions', 'question'),
+    ('answer_search', 'visitor_answers', 'answer_text'),
+)
+TRIGGERS = ('insert', 'delete', 'update')
+
+
+def fold_sql(value):
+    return f"replace(replace({value}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+def index_objects():
+    return sorted([search_table for search_table, _, _ in INDEX_TABLES]
+                  + [f'{search_table}_{trigger}' for search_table, _, _ in INDEX_TABLES for trigger in TRIGGERS])
+
+
+def missing_index_objects(cursor):
+    # SQLite удаляет триггеры, когда Django пересоздает таблицу (AlterField, RemoveField), индекс молча отстает.
+    cursor.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')")
+    existing = {row[0] for row in cursor.fetchall()}
+    return [name for name in index_objects() if name not in existing]
+
+
+def create_index(cursor):
+    for search_table, table, column in INDEX_TABLES:
+        cursor.execute(f"CREATE VIRTUAL TABLE {search_table} USING fts5({column}, content='', "
+                       f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')")
+        # Пустые значения в индекс не попадают, удаление и вставка при изменении идут строго по порядку.
+        delete = f"INSERT INTO {search_table}({search_table}, rowid, {column}) " \
+                 f"SELECT 'delete', old.id, {fold_sql(f'old.{column}')} WHERE old.{column} IS NOT NULL;"
+        insert = f"INSERT INTO {search_table}(rowid, {column}) " \
+                 f"SELECT new.id, {fold_sql(f'new.{column}')} WHERE new.{column} IS NOT NULL;"
+        cursor.execute(f'CREATE TRIGGER {search_table}_insert AFTER INSERT ON {table} BEGIN {insert} END')
+        cursor.execute(f'CREATE TRIGGER {search_table}_delete AFTER DELETE ON {table} BEGIN {delete} END')
+        cursor.execute(f'CREATE TRIGGER {search_table}_update AFTER UPDATE OF {column} ON {table} '
+                       f'BEGIN {delete} {insert} END')
+        cursor.execute(f"INSERT INTO {search_table}(rowid, {column}) "
+                       f"SELECT id, {fold_sql(column)} FROM {table} WHERE {column} IS NOT NULL")
+
+
+def drop_index(cursor):
+    for search_table, _, _ in INDEX_TABLES:
+        for trigger in TRIGGERS: cursor.execute(f'DROP TRIGGER IF EXISTS {search_table}_{trigger}')
+        cursor.execute(f'DROP TABLE IF EXISTS {search_table}')
+
+
+def rebuild_index():
+    with transaction.atomic(), connection.cursor() as cursor:
+        drop_index(cursor)
+        create_index(cursor)
+
+
+def words(query):
+    # ё -> е, как в триггерах индекса.
+    return WORD.findall(query.replace('ё', 'е').replace('Ё', 'Е'))
+
+
+def match_expression(query_words):
+    # Каждое слово в кавычках - синтаксис FTS5 из запроса не выполняется. Все слова обязательны, ищем по префиксу.
+    return ' '.join(f'"{word}"*' for word in query_words)
+
+
+def fts_search(scope, query_words, author_id, limit, offset):
+    sql, fields = (QUESTIONS_SQL, QUESTION_FIELDS) if scope == 'questions' else (ANSWERS_SQL, ANSWER_FIELDS)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [match_expression(query_words), author_id, limit, offset])
+        results = [dict(zip(fields, row)) for row in cursor.fetchall()]
+    # SQLite отдает bool как 0/1.
+    for result in results:
+        if 'archived' in result: result['archived'] = bool(result['archived'])
+    return results
+
+
+def fold(field):
+    # ё -> е в самой колонке: words() уже заменил ё в запросе.
+    return Replace(Replace(F(field), Value('ё'), Value('е')), Value('Ё'), Value('Е'))
+
+
+def like_search(scope, query_words, author_id, limit, offset):
+    # Без FTS5: icontains по каждому слову, свежие записи первыми.
+    if scope == 'questions':
+        queryset = Question.objects.filter(quiz__author_id=author_id).annotate(search_text=fold('question'))
+        fields, values = QUESTION_FIELDS, ('id', 'quiz_id', 'question', 'archived')
+    else:
+        queryset = UserAnswer.objects.filter(question__quiz__author_id=author_id).annotate(search_text=fold('answer_text'))
+        fields, values = ANSWER_FIELDS, ('id', 'question__quiz_id', 'question_id', 'question__question', 'visitor_id',
+                                         'answer_text')
+    for word in query_words: queryset = queryset.filter(search_text__icontains=word)
+    return [dict(zip(fields, row + (None,))) for row in queryset.values_list(*values).order_by('-id')[offset:offset + limit]]
+
+
+def search(scope, query, author_id, limit, offset):
+    query_words = words(query)
+    if not query_words: return []
+    if connection.vendor == 'sqlite': return fts_search(scope, query_words, author_id, limit, offset)
+    return like_search(scope, query_words, author_id, limit, offset)
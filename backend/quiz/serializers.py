@@ -1,8 +1,19 @@
+from django.db.models import Prefetch
 from rest_framework import serializers
 
 from .models import *
 
 
+def questions_queryset():
+    return Question.objects.filter(archived=False).select_related('type_question').prefetch_related('variableanswer_set')
+
+
+# Подгружаем вопросы и варианты ответов заранее, чтобы QuizSerializer не делал запросов на каждый вопрос.
+def prefetch_quiz(queryset):
+    return queryset.prefetch_related(Prefetch('question_set', queryset=questions_queryset(), to_attr='active_questions'))
+
+
+# Горячие пути чтения (снимки опросов, история) сериализуют через quiz/rows.py, формат нужно менять в обоих местах.
 class QuizSerializer(serializers.ModelSerializer):
     start = serializers.DateTimeField(format="%d.%m.%Y %H:%M")
     end = serializers.DateTimeField(format="%d.%m.%Y %H:%M")
@@ -15,7 +26,8 @@ class QuizSerializer(serializers.ModelSerializer):
 
     @staticmethod
     def get_questions(obj):
-        questions = Question.objects.filter(quiz=obj.id, archived=False)
+        questions = getattr(obj, 'active_questions', None)
+        if questions is None: questions = questions_queryset().filter(quiz=obj.id)
         return QuestionsSerializer(questions, many=True).data
 
     @staticmethod
@@ -37,8 +49,8 @@ class QuestionsSerializer(serializers.ModelSerializer):
 
     @staticmethod
     def get_variable_answer(obj):
-        variable_answer = VariableAnswer.objects.filter(question=obj.id)
-        return VariableAnswerSerializer(variable_answer, many=True).data
+        # Если варианты подгружены через prefetch_related, .all() не делает запроса.
+        return VariableAnswerSerializer(obj.variableanswer_set.all(), many=True).data
 
 
 class VariableAnswerSerializer(serializers.ModelSerializer):
@@ -47,6 +59,12 @@ class VariableAnswerSerializer(serializers.ModelSerializer):
         fields = ('id', 'text')
 
 
+class QuizHistorySerializer(QuizSerializer):
+    class Meta:
+        model = Quiz
+        fields = ('id', 'name', 'description', 'start', 'end', 'status',)
+
+
 class HistoryAnswersSerializer(serializers.ModelSerializer):
     question_text = serializers.CharField(source='question.question')
     variable_answer_text = serializers.SerializerMethodField()
@@ -56,11 +74,11 @@ class HistoryAnswersSerializer(serializers.ModelSerializer):
         model = UserAnswer
         fields = ('id', 'question', 'question_text', 'answer_text', 'variable_answer_ids', 'variable_answer_text')
 
+    # Варианты берутся из prefetch_related('variable_answer'), если он был сделан.
     @staticmethod
     def get_variable_answer_ids(obj):
-        return obj.variable_answer.values_list('id')
+        return [(_.id,) for _ in sorted(obj.variable_answer.all(), key=lambda _: _.id)]
 
     @staticmethod
     def get_variable_answer_text(obj):
-        variable_answer = VariableAnswer.objects.filter(id__in=obj.variable_answer.values_list('id'))
-        return [_.text for _ in variable_answer]
+        return [_.text for _ in sorted(obj.variable_answer.all(), key=lambda _: _.id)]
@@ -1,12 +1,38 @@
-from datetime import datetime
+import hashlib
+import logging
+import math
+from collections import Counter
+from datetime import datetime, timedelta
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.db import IntegrityError, InterfaceError, OperationalError, transaction
+from django.db.models import Count, F, Min, Q
+from . import analytics, export, rows, search, snapshots
+from .renderers import ORJSONRenderer
+from .routers import pin_primary, replica_reads
+from .answer_queue import answer_queue
+from .registry import type_question_registry
+from .tokens import token_cache
 from .models import *
 from .serializers import *
 
 
+logger = logging.getLogger(__name__)
+
+
+def load_user(user_id):
+    try:
+        with replica_reads() as replica:
+            user = get_user_model().objects.filter(id=user_id).first()
+        # Только что созданного пользователя на реплике может еще не быть, а промах попадет в кеш токенов.
+        if not user and replica: user = get_user_model().objects.filter(id=user_id).first()
+        return user
+    except ValueError:
+        return None
+
+
 def check_user(user_id):
-    user = get_user_model().objects.filter(id=user_id)
-    if user: return user[0]
+    return token_cache.get(user_id, load_user)
 
 
 def create_quiz(name, description, date_start, date_end, author):
@@ -37,14 +63,76 @@ def update_quiz(quiz_id, name, description, date_end, author):
         quiz.end = date_end
 
     quiz.save()
-    return QuizSerializer(quiz).data
+    return refresh_quiz_snapshot(quiz.id)
+
+
+def load_quiz(quiz_id):
+    quiz = rows.load_quizzes(Quiz.objects.filter(id=quiz_id))
+
+    if not quiz: return None
+    return quiz[0]
 
 
 def get_quiz(quiz_id):
-    quiz = Quiz.objects.filter(id=quiz_id)
+    with replica_reads():
+        quiz = load_quiz(quiz_id)
+
+    if not quiz: return None
+    return rows.quiz_data(quiz)
+
+
+def quiz_etag(quiz):
+    return f'{quiz.id}.{quiz.version}'
+
+
+def set_quiz_snapshot(quiz, version):
+    data = rows.quiz_data(quiz)
+    return data, snapshots.set_snapshot(quiz.id, version, data, quiz_etag(quiz), int(quiz.modified.timestamp()))
+
+
+def get_quiz_snapshot(quiz_id):
+    version, snapshot = snapshots.get_snapshot(quiz_id)
+    if snapshot is not None: return snapshot
 
+    # После изменения опроса снимок собирается с основной базы, с реплики - только вытесненный из кеша.
+    with replica_reads():
+        quiz = load_quiz(quiz_id)
     if not quiz: return None
-    return QuizSerializer(quiz[0]).data
+    return set_quiz_snapshot(quiz, version)[1]
+
+
+def get_quiz_snapshots(quiz_ids):
+    # Снимки нескольких опросов: из кеша, недостающие собираются за фиксированное число запросов.
+    versions, quiz_snapshots = snapshots.get_snapshots(quiz_ids)
+    missing = [quiz_id for quiz_id in quiz_ids if quiz_id not in quiz_snapshots]
+    if missing:
+        with replica_reads():
+            quizzes = rows.load_quizzes(Quiz.objects.filter(id__in=missing))
+        for quiz in quizzes: quiz_snapshots[quiz.id] = set_quiz_snapshot(quiz, versions[quiz.id])[1]
+    return quiz_snapshots
+
+
+def get_quiz_batch(quiz_ids):
+    quiz_snapshots = get_quiz_snapshots(quiz_ids)
+    found = [quiz_snapshots[quiz_id] for quiz_id in quiz_ids if quiz_id in quiz_snapshots]
+    missing = [quiz_id for quiz_id in quiz_ids if quiz_id not in quiz_snapshots]
+
+    # Ответ склеивается из уже отрендеренных снимков, без повторной сериализации.
+    content = b'{"quizzes":[' + b','.join(_.content for _ in found) + b'],"missing":' \
+              + ORJSONRenderer().render(missing) + b'}'
+    etag = hashlib.md5(repr(([_.etag for _ in found], missing)).encode()).hexdigest()
+    return snapshots.Snapshot(etag, max((_.last_modified for _ in found), default=None), content)
+
+
+def refresh_quiz_snapshot(quiz_id):
+    # Вызывается после любого изменения опроса: версия опроса растет, новая версия снимка собирается сразу.
+    Quiz.objects.filter(id=quiz_id).update(version=F('version') + 1, modified=datetime.now())
+    version = snapshots.bump_version(quiz_id)
+    # update() не вызывает post_save, набор активных опросов сбрасываем сами.
+    snapshots.bump_active_version()
+    quiz = load_quiz(quiz_id)
+    if not quiz: return None
+    return set_quiz_snapshot(quiz, version)[0]
 
 
 def delete_quiz(quiz_id, author):
@@ -54,32 +142,43 @@ def delete_quiz(quiz_id, author):
     quiz = quiz[0]
     quiz.archived = True
     quiz.save()
+    refresh_quiz_snapshot(quiz.id)
     return 1
 
 
 def create_questions(quiz_id, questions, author):
-    quiz = Quiz.objects.filter(id=quiz_id, author=author)
-    if not quiz: return None
-    quiz = quiz[0]
+    with transaction.atomic():
+        quiz = Quiz.objects.select_for_update().filter(id=quiz_id, author=author)
+        if not quiz: return None
+        quiz = quiz[0]
 
-    last_position_question = Question.objects.filter(quiz=quiz).last()
-    if last_position_question: last_position_question = last_position_question.position + 1
+        last_position_question = Question.objects.filter(quiz=quiz).last()
+        if last_position_question: last_position_question = last_position_question.position + 1
 
-    i = last_position_question or 0
-    for question in questions:
-        text = question.get('text', None)
-        type_question_id = question.get('type_question', None)
-        variable_answers = question.get('variable_answer', [])
+        first_position = i = last_position_question or 0
+        new_questions, new_variable_answers = [], []
+        for question in questions:
+            text = question.get('text', None)
+            type_question_id = question.get('type_question', None)
+            variable_answers = question.get('variable_answer', [])
 
-        type_question = TypeQuestion.objects.filter(id=type_question_id)
+            type_question = type_question_registry.get(type_question_id)
 
-        if type_question and (type_question_id == 1 or (type_question_id in (2, 3,) and variable_answers)):
-            question = Question.objects.create(quiz=quiz, question=text, position=i, type_question=type_question[0])
-            if type_question_id in (2, 3,):
-                for text_answer in variable_answers: VariableAnswer.objects.create(text=text_answer, question=question)
-            i += 1
+            if type_question and (type_question_id == 1 or (type_question_id in (2, 3,) and variable_answers)):
+                new_questions.append(Question(quiz=quiz, question=text, position=i, type_question=type_question))
+                new_variable_answers.append(variable_answers if type_question_id in (2, 3,) else [])
+                i += 1
 
-    return QuizSerializer(quiz).data
+        Question.objects.bulk_create(new_questions)
+        if new_questions and new_questions[0].id is None:
+            # SQLite и MySQL не возвращают id после bulk_create, позиции новых вопросов уникальны.
+            ids = dict(Question.objects.filter(quiz=quiz, position__gte=first_position).values_list('position', 'id'))
+            for question in new_questions: question.id = ids[question.position]
+        VariableAnswer.objects.bulk_create([VariableAnswer(text=text_answer, question=question)
+                                            for question, variable_answers in zip(new_questions, new_variable_answers)
+                                            for text_answer in variable_answers])
+
+    return refresh_quiz_snapshot(quiz.id)
 
 
 def update_question(question_id, question, author):
@@ -87,23 +186,28 @@ def update_question(question_id, question, author):
     type_question_id = question.get('type_question', None)
     variable_answers = question.get('variable_answer', [])
 
-    type_question = TypeQuestion.objects.filter(id=type_question_id)
-    question = Question.objects.filter(id=question_id, quiz__author=author)
-    if not question: return
-    question = question[0]
+    type_question = type_question_registry.get(type_question_id)
+    with transaction.atomic():
+        question = Question.objects.filter(id=question_id, quiz__author=author)
+        if not question: return
+        question = question[0]
 
-    if text: question.question = text
-    if type_question and (type_question_id == 1 or (type_question_id in (2, 3) and variable_answers)):
-        # Удалить старые варианты ответа
-        if question.type_question.id in (2, 3) and type_question[0].id == 1:
-            VariableAnswer.objects.filter(question=question).delete()
-        question.type_question = type_question[0]
+        if text: question.question = text
+        if type_question and (type_question_id == 1 or (type_question_id in (2, 3) and variable_answers)):
+            # Удалить старые варианты ответа
+            if question.type_question_id in (2, 3) and type_question.id == 1:
+                VariableAnswer.objects.filter(question=question).delete()
+            question.type_question = type_question
 
-    if variable_answers and question.type_question.id in (2, 3):
-        for text_answer in variable_answers: VariableAnswer.objects.create(text=text_answer, question=question)
+        if variable_answers and question.type_question_id in (2, 3):
+            # Добавляем только новые варианты, существующие варианты и ответы на них не трогаем.
+            exists_answers = set(VariableAnswer.objects.filter(question=question).values_list('text', flat=True))
+            VariableAnswer.objects.bulk_create([VariableAnswer(text=text_answer, question=question)
+                                                for text_answer in dict.fromkeys(variable_answers)
+                                                if text_answer not in exists_answers])
 
-    question.save()
-    return QuizSerializer(question.quiz).data
+        question.save()
+    return refresh_quiz_snapshot(question.quiz_id)
 
 
 def delete_question(question_id, author):
@@ -113,72 +217,332 @@ def delete_question(question_id, author):
 
     question.archived = True
     question.save()
-    return QuizSerializer(question.quiz).data
+    return refresh_quiz_snapshot(question.quiz_id)
 
 
-def get_active_quiz(user):
-    quizzes = Quiz.objects.filter(start__lte=datetime.now(), end__gte=datetime.now(), archived=False).exclude(id__in=UserAnswer.objects.filter(visitor=user).values_list('question__quiz__id', flat=True).distinct())
+def active_quizzes(user, now):
+    return Quiz.objects.filter(start__lte=now, end__gte=now, archived=False).exclude(id__in=QuizCompletion.objects.filter(visitor=user).values('quiz_id'))
+
+
+def get_active_quiz_ids():
+    now = datetime.now()
+    version, active = snapshots.get_active_quizzes()
+    if active is not None and now < active.valid_until: return active
 
-    return QuizSerializer(quizzes, many=True).data
+    # Собираем с основной базы: после изменения опроса отстающая реплика вернула бы старый набор.
+    quizzes = Quiz.objects.filter(archived=False)
+    ids = tuple(quizzes.filter(start__lte=now, end__gte=now).order_by('id').values_list('id', flat=True))
+    boundaries = quizzes.aggregate(start=Min('start', filter=Q(start__gt=now)), end=Min('end', filter=Q(end__gte=now)))
+    # Опрос активен, пока end >= now, и выпадает из набора сразу после end.
+    if boundaries['end']: boundaries['end'] += timedelta(microseconds=1)
+    valid_until = min([_ for _ in boundaries.values() if _] + [now + timedelta(seconds=settings.ACTIVE_QUIZ_IDS_TIMEOUT)])
 
+    active = snapshots.ActiveQuizzes(ids, valid_until, int(now.timestamp()))
+    snapshots.set_active_quizzes(version, active, math.ceil((valid_until - now).total_seconds()))
+    return active
 
-def validate_answer(visitor_answers, quiz_question_ids, quiz_question):
-    i = 0
+
+def get_active_quiz(user):
+    # Общий набор активных опросов из кеша, пройденные пользователем отсеиваются в памяти,
+    # ответ склеивается из снимков опросов. Возвращает Snapshot списка или None, если опросов нет.
+    active = get_active_quiz_ids()
+    if not active.ids: return None
+    with replica_reads(user.id):
+        completed = dict(QuizCompletion.objects.filter(visitor=user, quiz_id__in=active.ids
+                                                       ).values_list('quiz_id', 'created'))
+    quiz_ids = [quiz_id for quiz_id in active.ids if quiz_id not in completed]
+    quiz_snapshots = get_quiz_snapshots(quiz_ids) if quiz_ids else {}
+    found = [quiz_snapshots[quiz_id] for quiz_id in quiz_ids if quiz_id in quiz_snapshots]
+    if not found: return None
+
+    # ETag задают версии опросов из списка. Last-Modified - самое позднее событие, после которого список
+    # мог измениться: правка опроса, сборка набора активных опросов, прохождение опроса пользователем.
+    etag = hashlib.md5(repr([_.etag for _ in found]).encode()).hexdigest()
+    last_modified = max([_.last_modified for _ in found] + [int(_.timestamp()) for _ in completed.values()]
+                        + [active.built])
+    return snapshots.Snapshot(etag, last_modified, b'[' + b','.join(_.content for _ in found) + b']')
+
+
+def sync_token(now=None):
+    return round((now or datetime.now()).timestamp() * 1000000)
+
+
+def get_active_quiz_changes(user, since):
+    # Изменения списка активных опросов с момента since (токен - время в микросекундах).
+    # changed - опросы, ставшие активными или измененные, целиком; removed - id опросов, которые нужно убрать:
+    # отправленные в архив, закончившиеся, удаленные или пройденные пользователем. Без since - весь список.
+    now = datetime.now()
+    token = sync_token(now)
+    since = since and datetime.fromtimestamp(since / 1000000) - timedelta(seconds=settings.ACTIVE_QUIZ_SYNC_OVERLAP)
+
+    with replica_reads(user.id):
+        quizzes = active_quizzes(user, now)
+        if since: quizzes = quizzes.filter(Q(modified__gt=since) | Q(start__gt=since))
+        changed = [rows.quiz_data(quiz) for quiz in rows.load_quizzes(quizzes)]
+        if not since: return {'token': token, 'changed': changed, 'removed': []}
+
+        removed = Quiz.objects.filter(Q(modified__gt=since) | Q(end__gt=since, end__lt=now), start__lte=now).exclude(
+            id__in=active_quizzes(user, now).values('id')).values_list('id', flat=True)
+        completed = QuizCompletion.objects.filter(visitor=user, created__gt=since).values_list('quiz_id', flat=True)
+        deleted = QuizTombstone.objects.filter(deleted__gt=since).values_list('quiz_id', flat=True)
+        removed = sorted(set(removed) | set(completed) | set(deleted))
+
+    return {'token': token, 'changed': changed, 'removed': removed}
+
+
+def record_quiz_deletion(sender, instance, **kwargs):
+    # post_delete шлется и при каскадном удалении (вместе с автором), удаление сырым SQL надгробия не оставит.
+    QuizTombstone.objects.create(quiz_id=instance.id)
+
+
+def validate_answer(visitor_answers, quiz_question):
+    # quiz_question - словарь {id вопроса: вопрос} с подгруженными вариантами ответа.
+    answered = set()
     for answer in visitor_answers:
         answer_question_id = answer.get('id', 0)
-        if answer_question_id not in quiz_question_ids: return '404'
-        # Т.к всегда очищаем список и у нас получается нулевой элемент.
-        question = quiz_question[quiz_question_ids.index(answer_question_id)+i]
-        if question.type_question.id == 1 and not answer.get('text', None):
+        question = quiz_question.get(answer_question_id)
+        if not question or answer_question_id in answered: return '404'
+        if question.type_question_id == 1 and not answer.get('text', None):
             return f'Ответ на вопрос {answer_question_id}.\nОтсутсвует текст овтета.'
-        elif question.type_question.id in (2, 3) \
-                and (not answer.get('variable', None) or list(set(answer['variable']) - set(VariableAnswer.objects.filter(question=question).values_list('id', flat=True)))):
+        elif question.type_question_id in (2, 3) \
+                and (not answer.get('variable', None) or set(answer['variable']) - {_.id for _ in question.variableanswer_set.all()}):
             # Проверяем, чтоб в ответах пользователя не было лишних id.
             return f'Ответ на вопрос {answer_question_id}.\nВ списке отсутсвуют варианты ответов или есть неверные id.'
-        quiz_question_ids.remove(answer_question_id)
-        i += 1
+        answered.add(answer_question_id)
+
+
+def save_answers(submissions):
+    # submissions - список (id пользователя, ответы, {id вопроса: вопрос}), все пишется одним bulk_create.
+    user_answers, variables = [], []
+    for visitor_id, visitor_answers, quiz_question in submissions:
+        for answer in visitor_answers:
+            question = quiz_question[answer['id']]
+            # Если пользователь шлет лишние ключи
+            if question.type_question_id == 1: text = answer.get('text', None)
+            else: text = None
+            user_answers.append(UserAnswer(visitor_id=visitor_id, answer_text=text, question=question))
+
+            if question.type_question_id == 2: variables.append({answer['variable'][0]})
+            elif question.type_question_id == 3: variables.append(set(answer['variable']))
+            else: variables.append(set())
+    UserAnswer.objects.bulk_create(user_answers)
+
+    if user_answers and user_answers[0].id is None:
+        # SQLite и MySQL не возвращают id после bulk_create, забираем их одним запросом.
+        ids = UserAnswer.objects.filter(visitor_id__in={_.visitor_id for _ in user_answers},
+                                        question_id__in={_.question_id for _ in user_answers}
+                                        ).order_by('id').values_list('visitor_id', 'question_id', 'id')
+        ids = {(visitor_id, question_id): user_answer_id for visitor_id, question_id, user_answer_id in ids}
+        for user_answer in user_answers: user_answer.id = ids[(user_answer.visitor_id, user_answer.question_id)]
+
+    through = UserAnswer.variable_answer.through
+    through.objects.bulk_create([through(useranswer_id=user_answer.id, variableanswer_id=variable_id)
+                                 for user_answer, variable_ids in zip(user_answers, variables)
+                                 for variable_id in variable_ids])
+
+    responses = Counter(quiz_question[visitor_answers[0]['id']].quiz_id
+                        for _, visitor_answers, quiz_question in submissions if visitor_answers)
+    variable_answers = Counter((user_answer.question.quiz_id, variable_id)
+                               for user_answer, variable_ids in zip(user_answers, variables)
+                               for variable_id in variable_ids)
+    update_tallies(responses, variable_answers)
+    return user_answers
+
+
+def increment_tallies(model, key_field, counter_field, counts):
+    # Одно обновление на каждое значение прибавки, для одной отправки это всегда один запрос.
+    increments = {}
+    for key, count in counts.items(): increments.setdefault(count, []).append(key)
+    for count, keys in increments.items():
+        model.objects.filter(**{f'{key_field}__in': keys}).update(**{counter_field: F(counter_field) + count})
+
+
+def update_tallies(responses, variable_answers):
+    # responses - {id опроса: число прохождений}, variable_answers - {(id опроса, id варианта): число выборов}.
+    if responses:
+        QuizTally.objects.bulk_create([QuizTally(quiz_id=quiz_id) for quiz_id in responses], ignore_conflicts=True)
+        increment_tallies(QuizTally, 'quiz_id', 'responses', responses)
+    if variable_answers:
+        VariableAnswerTally.objects.bulk_create([VariableAnswerTally(quiz_id=quiz_id, variable_answer_id=variable_id)
+                                                 for quiz_id, variable_id in variable_answers], ignore_conflicts=True)
+        increment_tallies(VariableAnswerTally, 'variable_answer_id', 'count',
+                          {variable_id: count for (_, variable_id), count in variable_answers.items()})
+
+
+def prepare_answer_quiz(quiz_id, answers, visitor):
+    quiz = Quiz.objects.filter(id=quiz_id)
+    if not quiz or QuizCompletion.objects.filter(visitor=visitor, quiz=quiz[0]).exists():
+        return None, None, 'Вы уже проходили этот опрос или опрос недоступен.'
+    quiz = quiz[0]
+    quiz_question = {question.id: question for question in
+                     Question.objects.filter(quiz=quiz, archived=False).prefetch_related('variableanswer_set')}
+    visitor_answers = answers.get('answers')
+    if len(quiz_question) != len(visitor_answers): return None, None, 'Не на все вопросы был предоставлен ответ.'
 
-    return quiz_question_ids
+    error_answers = validate_answer(visitor_answers, quiz_question)
+    if error_answers: return None, None, error_answers
+    return quiz, quiz_question, None
 
 
 def create_answer_quiz(quiz_id, answers, visitor):
-    quiz = Quiz.objects.filter(id=quiz_id
-                               ).exclude(id__in=UserAnswer.objects.filter(visitor=visitor).values_list('question__quiz__id', flat=True).distinct())
-    if not quiz: return {'error': 'Вы уже проходили этот опрос или опрос недоступен.'}, 1
-    quiz_question = Question.objects.filter(quiz=quiz[0], archived=False)
-    visitor_answers = answers.get('answers')
-    if len(quiz_question) != len(visitor_answers): return {'error': 'Не на все вопросы был предоставлен ответ.'}, 1
-
-    quiz_question_ids = list(quiz_question.values_list('id', flat=True))
-    error_answers = validate_answer(visitor_answers, quiz_question_ids, quiz_question)
-    if error_answers: return {'error': error_answers}, 1
-
-    # Список очищался при валидации.
-    quiz_question_ids = list(quiz_question.values_list('id', flat=True))
-    for answer in answers['answers']:
-        question = quiz_question[quiz_question_ids.index(answer.get('id'))]
-        # Если пользователь шлет лишние ключи
-        if question.type_question.id == 1: text = answer.get('text', None)
-        else: text = None
-        user_answer_obj = UserAnswer(visitor=visitor, answer_text=text, question=question)
-
-        user_answer_obj.save()
-        if question.type_question.id == 2:
-            user_answer_obj.variable_answer.add(VariableAnswer.objects.get(id=answer['variable'][0]))
-        elif question.type_question.id == 3:
-            for answer_variable_id in answer['variable']:
-                user_answer_obj.variable_answer.add(VariableAnswer.objects.get(id=answer_variable_id))
+    quiz, quiz_question, error = prepare_answer_quiz(quiz_id, answers, visitor)
+    if error: return {'error': error}, 1
 
+    try:
+        with transaction.atomic():
+            # Уникальный индекс (visitor, quiz) не даст записать ответы дважды при одновременных запросах.
+            QuizCompletion.objects.create(visitor=visitor, quiz=quiz)
+            save_answers([(visitor.id, answers['answers'], quiz_question)])
+    except IntegrityError:
+        return {'error': 'Вы уже проходили этот опрос или опрос недоступен.'}, 1
+
+    pin_primary(visitor.id)
     return {'detail': 'Ваши ответы записаны.'}, 0
 
 
-def get_history_answers(visitor):
-    quizzes = Quiz.objects.filter(id__in=UserAnswer.objects.filter(visitor=visitor).values_list('question__quiz__id', flat=True).distinct())
-    quizzes_serializer = QuizSerializer(quizzes, many=True).data
+def enqueue_answer_quiz(quiz_id, answers, visitor):
+    quiz, quiz_question, error = prepare_answer_quiz(quiz_id, answers, visitor)
+    if error: return {'error': error}, 1
+
+    # Сразу резервируем прохождение опроса, сами ответы запишет воркер.
+    try:
+        completion = QuizCompletion.objects.create(visitor=visitor, quiz=quiz)
+    except IntegrityError:
+        return {'error': 'Вы уже проходили этот опрос или опрос недоступен.'}, 1
+    try:
+        answer_queue.put(visitor.id, quiz.id, answers['answers'])
+    except Exception:
+        completion.delete()
+        raise
+
+    # Ответы запишет воркер, до этого история пользователя читается с основной базы.
+    pin_primary(visitor.id)
+    return {'detail': 'Ваши ответы приняты.'}, 0
+
 
-    for quiz in quizzes_serializer:
-        del quiz['questions']
-        serializer = HistoryAnswersSerializer(UserAnswer.objects.filter(question__quiz__id=quiz['id']), many=True).data
-        quiz.update({'answers': serializer})
+def save_queued_answers(items, quiz_question):
+    # Если воркер упал между коммитом и ack, ответы уже в базе: такие отправки не пишем второй раз.
+    written = set(UserAnswer.objects.filter(
+        visitor_id__in={visitor_id for _, visitor_id, _, _ in items}, question__quiz_id__in={quiz_id for _, _, quiz_id, _ in items}
+    ).values_list('visitor_id', 'question__quiz_id').distinct())
+    submissions = []
+    for _, visitor_id, quiz_id, answers in items:
+        if (visitor_id, quiz_id) in written: continue
+        written.add((visitor_id, quiz_id))
+        submissions.append((visitor_id, answers, quiz_question.get(quiz_id, {})))
+    save_answers(submissions)
 
-    return quizzes_serializer
+
+def drain_answer_queue(batch_size):
+    items = answer_queue.take(batch_size)
+    if not items: return 0
+
+    try:
+        # Вопросы берем вместе с архивными: вопрос могли убрать в архив, пока ответ ждал в очереди.
+        quiz_question = {}
+        for question in Question.objects.filter(quiz_id__in={quiz_id for _, _, quiz_id, _ in items}):
+            quiz_question.setdefault(question.quiz_id, {})[question.id] = question
+        with transaction.atomic():
+            save_queued_answers(items, quiz_question)
+    except (OperationalError, InterfaceError):
+        # База временно недоступна: ответы остаются в очереди, воркер повторит попытку.
+        logger.exception('Не удалось записать ответы из очереди, база недоступна')
+        answer_queue.release([item[0] for item in items])
+        return 0
+    except Exception:
+        # Разбираем пачку по одному, чтобы один битый ответ не блокировал очередь.
+        for i, item in enumerate(items):
+            try:
+                with transaction.atomic():
+                    save_queued_answers([item], quiz_question)
+            except (OperationalError, InterfaceError):
+                logger.exception('Не удалось записать ответы из очереди, база недоступна')
+                answer_queue.release([_[0] for _ in items[i:]])
+                return i
+            except Exception:
+                # Ошибкой помечаются только ответы, которые не проходят проверку. Вернуть их: --retry-failed.
+                logger.exception('Не удалось записать ответы из очереди: %s', item[0])
+                answer_queue.fail([item[0]])
+            else:
+                answer_queue.ack([item[0]])
+        return len(items)
+
+    answer_queue.ack([item_id for item_id, _, _, _ in items])
+    return len(items)
+
+
+def get_quiz_stats(quiz_id, author):
+    quiz = Quiz.objects.filter(id=quiz_id, author=author).select_related('tally')
+    if not quiz: return None
+    quiz = quiz[0]
+    responses = quiz.tally.responses if hasattr(quiz, 'tally') else 0
+
+    questions = {}
+    variable_answers = VariableAnswer.objects.filter(question__quiz=quiz, question__archived=False
+                                                     ).select_related('question', 'tally').order_by('question__position', 'id')
+    for variable_answer in variable_answers:
+        question = questions.setdefault(variable_answer.question_id, {
+            'id': variable_answer.question_id, 'question': variable_answer.question.question,
+            'type_question_id': variable_answer.question.type_question_id, 'variable_answer': []})
+        count = variable_answer.tally.count if hasattr(variable_answer, 'tally') else 0
+        question['variable_answer'].append({'id': variable_answer.id, 'text': variable_answer.text, 'count': count,
+                                            'percent': round(count * 100 / responses, 2) if responses else 0})
+
+    return {'id': quiz.id, 'name': quiz.name, 'responses': responses, 'questions': list(questions.values())}
+
+
+def get_quiz_analytics(quiz_id, author, kind, question_a=None, question_b=None):
+    if not Quiz.objects.filter(id=quiz_id, author=author).exists(): return None
+    return analytics.quiz_analytics(int(quiz_id), kind, question_a, question_b)
+
+
+def export_quiz_answers(quiz_id, author, export_format):
+    if not Quiz.objects.filter(id=quiz_id, author=author).exists(): return None
+    return export.export_answers(quiz_id, export_format)
+
+
+def search_quizzes(author, query, scope, limit, offset):
+    # Берем на одну запись больше, чтобы понять, есть ли следующая страница.
+    results = search.search(scope, query, author.id, limit + 1, offset)
+    return {'results': results[:limit], 'next_offset': offset + limit if len(results) > limit else None}
+
+
+def rebuild_tallies(quiz_ids=None):
+    user_answers = UserAnswer.objects.all()
+    if quiz_ids: user_answers = user_answers.filter(question__quiz_id__in=quiz_ids)
+    responses = user_answers.order_by().values_list('question__quiz_id').annotate(Count('visitor_id', distinct=True))
+    variable_answers = UserAnswer.variable_answer.through.objects.filter(useranswer__in=user_answers).order_by(
+    ).values_list('variableanswer__question__quiz_id', 'variableanswer_id').annotate(Count('id'))
+
+    with transaction.atomic():
+        quiz_tallies, variable_answer_tallies = QuizTally.objects.all(), VariableAnswerTally.objects.all()
+        if quiz_ids:
+            quiz_tallies = quiz_tallies.filter(quiz_id__in=quiz_ids)
+            variable_answer_tallies = variable_answer_tallies.filter(quiz_id__in=quiz_ids)
+        quiz_tallies.delete()
+        variable_answer_tallies.delete()
+
+        QuizTally.objects.bulk_create([QuizTally(quiz_id=quiz_id, responses=count) for quiz_id, count in responses],
+                                      batch_size=1000)
+        VariableAnswerTally.objects.bulk_create([VariableAnswerTally(quiz_id=quiz_id, variable_answer_id=variable_id, count=count)
+                                                 for quiz_id, variable_id, count in variable_answers], batch_size=1000)
+
+
+def get_history_answers(visitor, cursor=None, limit=None):
+    with replica_reads(visitor.id):
+        return rows.history_answers(visitor, cursor=cursor, limit=limit)
+
+
+def stream_history_answers(visitor, page_size):
+    # Отдаем JSON-массив частями, в памяти только одна страница опросов.
+    renderer = ORJSONRenderer()
+    cursor, first = None, True
+    yield b'['
+    while True:
+        page = get_history_answers(visitor, cursor=cursor, limit=page_size)
+        for quiz in page:
+            yield (b'' if first else b',') + renderer.render(quiz)
+            first = False
+        if len(page) < page_size: break
+        cursor = page[-1]['id']
+    yield b']'
@@ -0,0 +1,97 @@
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .renderers import ORJSONRenderer
+
+
+# Снимок опроса - уже отрендеренный JSON. Ключ снимка содержит версию опроса,
+# поэтому снимок, собранный по устаревшим данным, никогда не перезапишет новый.
+# Вместе со снимком хранятся валидаторы для условных запросов: ETag и Last-Modified (unix time).
+Snapshot = namedtuple('Snapshot', ('etag', 'last_modified', 'content'))
+# Id активных опросов, общие для всех пользователей. Набор меняется только на границах start/end опросов,
+# поэтому действует до ближайшей границы (valid_until), built - когда собран (unix time).
+ActiveQuizzes = namedtuple('ActiveQuizzes', ('ids', 'valid_until', 'built'))
+ACTIVE_VERSION_KEY = 'quiz:active:version'
+
+
+def version_key(quiz_id):
+    return f'quiz:{quiz_id}:version'
+
+
+def snapshot_key(quiz_id, version):
+    return f'quiz:{quiz_id}:snapshot:{version}'
+
+
+def active_key(version):
+    return f'quiz:active:{version}'
+
+
+def read_version(key):
+    version = cache.get(key)
+    if version is None:
+        # Версия могла быть вытеснена из кеша, начинаем со значения, которого еще не было.
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def increment_version(key):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        return read_version(key)
+
+
+def get_version(quiz_id):
+    return read_version(version_key(quiz_id))
+
+
+def bump_version(quiz_id):
+    return increment_version(version_key(quiz_id))
+
+
+def get_snapshot(quiz_id):
+    version = get_version(quiz_id)
+    return version, cache.get(snapshot_key(quiz_id, version))
+
+
+def get_snapshots(quiz_ids):
+    # Версии и снимки нескольких опросов за два обращения к кешу. Возвращает версии всех опросов
+    # и найденные снимки {id опроса: снимок}.
+    keys = {quiz_id: version_key(quiz_id) for quiz_id in quiz_ids}
+    found = cache.get_many(keys.values())
+    versions = {quiz_id: found[key] if key in found else get_version(quiz_id) for quiz_id, key in keys.items()}
+
+    keys = {quiz_id: snapshot_key(quiz_id, version) for quiz_id, version in versions.items()}
+    found = cache.get_many(keys.values())
+    return versions, {quiz_id: found[key] for quiz_id, key in keys.items() if key in found}
+
+
+def set_snapshot(quiz_id, version, data, etag, last_modified):
+    snapshot = Snapshot(etag, last_modified, ORJSONRenderer().render(data))
+    cache.set(snapshot_key(quiz_id, version), snapshot, settings.QUIZ_SNAPSHOT_TIMEOUT)
+    return snapshot
+
+
+def get_active_quizzes():
+    version = read_version(ACTIVE_VERSION_KEY)
+    return version, cache.get(active_key(version))
+
+
+def set_active_quizzes(version, active_quizzes, timeout):
+    cache.set(active_key(version), active_quizzes, timeout)
+
+
+def bump_active_version():
+    # Версия набора лежит в кеше: в кеше процесса (locmem) ее сброс увидит только этот процесс,
+    # поэтому с несколькими воркерами нужен общий кеш (CACHE_URL).
+    return increment_version(ACTIVE_VERSION_KEY)
+
+
+def invalidate_active_quizzes(sender, **kwargs):
+    # Любое изменение опроса (создание, правка, архивация) сбрасывает набор активных опросов.
+    # QuerySet.update() сигналов не шлет, после него нужно вызвать bump_active_version().
+    bump_active_version()
@@ -1,12 +1,36 @@
+import asyncio
+import csv
 import json
+import os
+import tempfile
+import threading
+import time
+from io import StringIO
+from unittest import mock, skipIf
 from datetime import datetime, timedelta
-from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.contrib.auth import authenticate, get_user_model
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection, connections
+from asgiref.sync import async_to_sync
+from django.test import AsyncClient, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
 from rest_framework import status
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APITestCase
 
-from .models import TypeQuestion, Quiz, Question, UserAnswer, VariableAnswer
-from .serializers import QuizSerializer, QuestionsSerializer
+from . import analytics, async_views, checks, rows, search, services
+from .answer_queue import answer_queue
+from .management.commands import create_visitors
+from .metrics import metrics
+from .middleware import record_query
+from config.schema import get_schema
+from .models import TypeQuestion, Quiz, Question, UserAnswer, VariableAnswer, QuizCompletion, QuizTally
+from .registry import type_question_registry
+from .renderers import ORJSONRenderer, msgpack
+from .routers import ReplicaRouter, pin_primary, replica_reads
+from .serializers import HistoryAnswersSerializer, QuizHistorySerializer, QuizSerializer, QuestionsSerializer, \
+    prefetch_quiz, questions_queryset
+from .tokens import TokenCache, token_cache
 
 
 class CreatePromocodesCase(APITestCase):
@@ -21,7 +45,7 @@ class CreatePromocodesCase(APITestCase):
         visitor.set_password('visitor')
         quiz = Quiz.objects.create(name='Title', description='Description',
                                    start=datetime.strptime('12.02.2007 10:10', '%d.%m.%Y %H:%M'),
-                                   end=datetime.strptime('12.02.2025 10:10', '%d.%m.%Y %H:%M'), author=author)
+                                   end=datetime.strptime('12.02.2045 10:10', '%d.%m.%Y %H:%M'), author=author)
         questions = [
             {"text": "Напиши текст.", "type_question": 1},
             {"text": "Выбери ответ.", "type_question": 2, "variable_answer": ["Вариант1"]},
@@ -42,6 +66,7 @@ class CreatePromocodesCase(APITestCase):
                 i += 1
 
     def setUp(self):
+        cache.clear()
         self.author = get_user_model().objects.get(username='root')
         self.visitor = get_user_model().objects.get(username='visitor')
         self.quiz = Quiz.objects.get(id=1)
@@ -66,7 +91,7 @@ class CreatePromocodesCase(APITestCase):
         response = self.client.delete(f"/api/v1/quiz/?token={self.author.id}&quiz={self.quiz.id}")
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         response = self.client.get(f"/api/v1/quiz/?token={self.author.id}&quiz={self.quiz.id}")
-        self.assertEqual(response.data.get('status', None), 'Отправлен в архив')
+        self.assertEqual(response.json().get('status', None), 'Отправлен в архив')
         print('# Test "delete quiz": OK')
 
     def test_4_add_question(self):
@@ -115,7 +140,7 @@ class CreatePromocodesCase(APITestCase):
         print('Start Test "get active quiz"')
         response = self.client.get(f"/api/v1/quiz/active/?token={self.visitor.id}", content_type='application/json')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data, QuizSerializer([self.quiz], many=True).data)
+        self.assertEqual(response.json(), QuizSerializer([self.quiz], many=True).data)
         print('# Test "get active quiz": OK')
 
 
@@ -153,3 +178,885 @@ class CreatePromocodesCase(APITestCase):
         self.assertEqual(response.data[0].get('id', None), self.quiz.id)
         print('# Test "Check answer to quiz": OK')
 
+
+class QuizTestCase(TestCase):
+    # Общие данные для тестов опросов: типы вопросов, автор, посетитель и create_quiz.
+    @classmethod
+    def setUpTestData(cls):
+        for name in ('Ответ текстом', 'Выбрать ответ', 'Выбрать несколько вариантов'):
+            TypeQuestion.objects.create(name=name)
+        cls.author = get_user_model().objects.create(username='root', is_superuser=True)
+        cls.visitor = get_user_model().objects.create(username='visitor', is_superuser=False)
+
+    def setUp(self):
+        cache.clear()
+        type_question_registry.load()
+
+    @classmethod
+    def create_quiz(cls, count_questions, count_variables, type_question_id=3):
+        quiz = Quiz.objects.create(name='Title', description='Description', start=datetime.now() - timedelta(days=1),
+                                   end=datetime.now() + timedelta(days=1), author=cls.author)
+        type_question = TypeQuestion.objects.get(id=type_question_id)
+        for i in range(count_questions):
+            question = Question.objects.create(quiz=quiz, question=f'Вопрос {i}', position=i, type_question=type_question)
+            for j in range(count_variables):
+                VariableAnswer.objects.create(text=f'Вариант {j}', question=question)
+        return quiz
+
+
+class QueryCountCase(QuizTestCase):
+    def test_get_quiz(self):
+        small_quiz = self.create_quiz(1, 1)
+        big_quiz = self.create_quiz(20, 5)
+        with self.assertNumQueries(3):
+            services.get_quiz(small_quiz.id)
+        with self.assertNumQueries(3):
+            data = services.get_quiz(big_quiz.id)
+        self.assertEqual(data, QuizSerializer(big_quiz).data)
+
+    def test_get_active_quiz(self):
+        self.create_quiz(2, 2)
+        # Набор активных опросов и ближайшая граница, пройденные опросы и 3 запроса на снимки.
+        with self.assertNumQueries(6):
+            services.get_active_quiz(self.visitor)
+        # Дальше из базы читаются только пройденные пользователем опросы.
+        with self.assertNumQueries(1):
+            services.get_active_quiz(self.visitor)
+        for _ in range(5): self.create_quiz(10, 4)
+        with self.assertNumQueries(6):
+            data = json.loads(services.get_active_quiz(self.visitor).content)
+        self.assertEqual(len(data), 6)
+        self.assertEqual(data, QuizSerializer(Quiz.objects.all(), many=True).data)
+
+    def test_change_questions(self):
+        quiz = self.create_quiz(10, 3)
+        question = quiz.question_set.first()
+        # Изменение вопроса: вопрос, сохранение, 2 точки сохранения, версия опроса и 3 запроса на сериализацию.
+        with self.assertNumQueries(8):
+            services.update_question(question.id, {'text': 'Новый текст'}, self.author)
+        with self.assertNumQueries(6):
+            data = services.delete_question(question.id, self.author)
+        self.assertEqual(len(data['questions']), 9)
+
+
+class QuestionsCase(QuizTestCase):
+    def test_create_questions(self):
+        for count_questions in (2, 40):
+            quiz = self.create_quiz(0, 0)
+            questions = [{'text': f'Вопрос {i}', 'type_question': i % 3 + 1, 'variable_answer': ['Да', 'Нет']}
+                         for i in range(count_questions)]
+            # 2 точки сохранения, опрос, последняя позиция, вопросы, их id, варианты, версия опроса
+            # и 3 запроса на сериализацию.
+            with self.assertNumQueries(11):
+                data = services.create_questions(quiz.id, questions, self.author)
+            self.assertEqual([_['question'] for _ in data['questions']], [_['text'] for _ in questions])
+            self.assertEqual(data, QuizSerializer(quiz).data)
+
+    def test_update_variable_answers(self):
+        question = self.create_quiz(1, 0).question_set.get()
+        for _ in range(2):
+            services.update_question(question.id, {'variable_answer': ['Да', 'Нет', 'Да']}, self.author)
+        self.assertEqual(list(question.variableanswer_set.values_list('text', flat=True)), ['Да', 'Нет'])
+        services.update_question(question.id, {'variable_answer': ['Нет', 'Может быть']}, self.author)
+        self.assertEqual(list(question.variableanswer_set.values_list('text', flat=True)), ['Да', 'Нет', 'Может быть'])
+        services.update_question(question.id, {'type_question': 1}, self.author)
+        self.assertFalse(question.variableanswer_set.exists())
+
+
+class QuizSnapshotCase(QuizTestCase):
+    def test_quiz_snapshot(self):
+        quiz = self.create_quiz(3, 2)
+        snapshot = services.get_quiz_snapshot(quiz.id)
+        self.assertEqual(json.loads(snapshot.content), QuizSerializer(quiz).data)
+        # Повторное чтение не обращается к базе.
+        with self.assertNumQueries(0):
+            self.assertEqual(services.get_quiz_snapshot(quiz.id), snapshot)
+
+        question = quiz.question_set.first()
+        services.update_question(question.id, {'text': 'Новый текст'}, self.author)
+        with self.assertNumQueries(0):
+            snapshot = services.get_quiz_snapshot(quiz.id)
+        self.assertEqual(json.loads(snapshot.content)['questions'][0]['question'], 'Новый текст')
+
+        services.delete_quiz(quiz.id, self.author)
+        response = self.client.get(f"/api/v1/quiz/?token={self.author.id}&quiz={quiz.id}")
+        self.assertEqual(response.json()['status'], 'Отправлен в архив')
+
+
+class QuizStatsCase(QuizTestCase):
+    def test_quiz_stats(self):
+        quiz = self.create_quiz(2, 3)
+        questions = list(quiz.question_set.all())
+        variables = [list(question.variableanswer_set.values_list('id', flat=True)) for question in questions]
+        for i in range(4):
+            visitor = get_user_model().objects.create(username=f'visitor{i}')
+            answers = [{'id': questions[0].id, 'variable': variables[0][:i % 2 + 1]},
+                       {'id': questions[1].id, 'variable': [variables[1][0]]}]
+            self.assertEqual(services.create_answer_quiz(quiz.id, {'answers': answers}, visitor)[1], 0)
+
+        with self.assertNumQueries(2):
+            stats = services.get_quiz_stats(quiz.id, self.author)
+        self.assertEqual(stats['responses'], 4)
+        self.assertEqual([(_['count'], _['percent']) for _ in stats['questions'][0]['variable_answer']],
+                         [(4, 100), (2, 50), (0, 0)])
+        self.assertEqual([_['count'] for _ in stats['questions'][1]['variable_answer']], [4, 0, 0])
+
+        call_command('rebuild_quiz_tallies', stdout=StringIO())
+        self.assertEqual(services.get_quiz_stats(quiz.id, self.author), stats)
+        response = self.client.get(f'/api/v1/quiz/stats/?token={self.visitor.id}&quiz={quiz.id}')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        response = self.client.get(f'/api/v1/quiz/stats/?token={self.author.id}&quiz={quiz.id}')
+        self.assertEqual(response.data, stats)
+        response = self.client.get(f'/api/v1/quiz/stats/?token={self.author.id}&quiz=abc')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class QuizAnalyticsCase(QuizTestCase):
+    @skipIf(analytics.np is None, 'numpy не установлен')
+    def test_quiz_analytics(self):
+        quiz = self.create_quiz(2, 2)
+        questions = list(quiz.question_set.all())
+        variables = [list(question.variableanswer_set.values_list('id', flat=True)) for question in questions]
+        # Ответы: (вопрос 1, вопрос 2) - (A, A), (A, B), (A+B, B), (B, B).
+        choices = (([0], [0]), ([0], [1]), ([0, 1], [1]), ([1], [1]))
+        for i, (choice_a, choice_b) in enumerate(choices):
+            visitor = get_user_model().objects.create(username=f'visitor{i}')
+            answers = [{'id': questions[0].id, 'variable': [variables[0][_] for _ in choice_a]},
+                       {'id': questions[1].id, 'variable': [variables[1][_] for _ in choice_b]}]
+            services.create_answer_quiz(quiz.id, {'answers': answers}, visitor)
+
+        data = services.get_quiz_analytics(quiz.id, self.author, 'crosstab', questions[0].id, questions[1].id)
+        self.assertEqual(data['respondents'], 4)
+        self.assertEqual(data['table'], [[1, 2], [0, 2]])
+        data = services.get_quiz_analytics(quiz.id, self.author, 'distribution')
+        self.assertEqual([_['count'] for _ in data['variable_answer']], [3, 2, 1, 3])
+        data = services.get_quiz_analytics(quiz.id, self.author, 'cooccurrence')
+        self.assertEqual([data['table'][i][i] for i in range(4)], [3, 2, 1, 3])
+        self.assertEqual(data['table'][0][1], 1)
+
+        response = self.client.get(f'/api/v1/quiz/analytics/?token={self.author.id}&quiz={quiz.id}&kind=crosstab'
+                                   f'&question_a={questions[0].id}&question_b={questions[1].id}')
+        self.assertEqual(response.data['table'], [[1, 2], [0, 2]])
+        self.assertIsNone(services.get_quiz_analytics(quiz.id, self.visitor, 'distribution'))
+
+
+class ExportAnswersCase(QuizTestCase):
+    def test_export_answers(self):
+        quiz = self.create_quiz(2, 2)
+        questions = list(quiz.question_set.all())
+        VariableAnswer.objects.filter(question=questions[0]).update(text='Вариант; с разделителем')
+        visitors = [get_user_model().objects.create(username=f'visitor{i}') for i in range(3)]
+        for visitor in visitors:
+            answers = [{'id': question.id, 'variable': list(question.variableanswer_set.values_list('id', flat=True))}
+                       for question in questions]
+            services.create_answer_quiz(quiz.id, {'answers': answers}, visitor)
+
+        response = self.client.get(f'/api/v1/quiz/export/?token={self.author.id}&quiz={quiz.id}&output=ndjson')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows[0]['visitor_id'], visitors[0].id)
+        self.assertEqual(rows[0]['variable_answer_text'], ['Вариант; с разделителем'] * 2)
+
+        response = self.client.get(f'/api/v1/quiz/export/?token={self.author.id}&quiz={quiz.id}')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'id,visitor_id,question_id,question,answer_text,variable_answer_ids,variable_answer_text')
+        self.assertEqual(len(lines), 7)
+        row = next(csv.reader(lines[1:]))
+        self.assertEqual(json.loads(row[5]), rows[0]['variable_answer_ids'])
+        self.assertEqual(json.loads(row[6]), ['Вариант; с разделителем'] * 2)
+
+        response = self.client.get(f'/api/v1/quiz/export/?token={self.author.id}&quiz=abc')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        output = StringIO()
+        call_command('export_quiz_answers', quiz=quiz.id, stdout=output)
+        self.assertEqual(output.getvalue().splitlines(), lines)
+
+
+class ConditionalGetCase(QuizTestCase):
+    def test_conditional_get(self):
+        quiz = self.create_quiz(2, 2)
+        url = f'/api/v1/quiz/?token={self.visitor.id}&quiz={quiz.id}'
+        response = self.client.get(url)
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response.content), (304, b''))
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        # Разные записи одного id попадают в один снимок, нечисловой id отклоняется до обращения к кешу.
+        self.assertEqual(self.client.get(f'/api/v1/quiz/?quiz=0{quiz.id}', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get('/api/v1/quiz/?quiz=1a').status_code, status.HTTP_400_BAD_REQUEST)
+        # Id вне 64-битного INTEGER SQLite не должен доходить до базы (OverflowError и 500).
+        for bad_url in ('/api/v1/quiz/?quiz={}', '/api/v1/quiz/stats/?quiz={}', '/api/v1/quiz/export/?quiz={}',
+                        '/api/v1/quiz/analytics/?quiz={}', '/api/v1/quiz/batch/?quizzes=1,{}',
+                        '/api/v1/visitor/answers/?cursor={}'):
+            response = self.client.get(bad_url.format(2 ** 63) + f'&token={self.author.id}')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, bad_url)
+
+        services.update_question(quiz.question_set.first().id, {'text': 'Новый текст'}, self.author)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        url = f'/api/v1/quiz/active/?token={self.visitor.id}'
+        etag = self.client.get(url)['ETag']
+        # Без изменений список не сериализуется: из базы читаются только пройденные опросы.
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        answers = [{'id': question.id, 'variable': [question.variableanswer_set.first().id]}
+                   for question in quiz.question_set.all()]
+        services.create_answer_quiz(quiz.id, {'answers': answers}, self.visitor)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 204)
+
+
+class IndexesCase(QuizTestCase):
+    def assertUsesIndex(self, queryset, index):
+        # План SQLite состоит из строк вида "SEARCH quiz USING INDEX quiz_active_period_idx (start<?)".
+        plan = queryset.explain()
+        self.assertIn(f' INDEX {index} ', plan, plan)
+
+    @skipIf(connection.vendor != 'sqlite', 'План запроса проверяется только на SQLite.')
+    def test_indexes(self):
+        quizzes = [self.create_quiz(3, 2).id for _ in range(2)]
+        self.assertUsesIndex(services.active_quizzes(self.visitor, datetime.now()), 'quiz_active_period_idx')
+        self.assertUsesIndex(questions_queryset().filter(quiz_id__in=quizzes), 'questions_active_idx')
+        self.assertUsesIndex(UserAnswer.objects.filter(visitor=self.visitor, question__quiz__in=quizzes),
+                             'visitor_answers_visitor_q_idx')
+        self.assertUsesIndex(Question.objects.filter(quiz_id=quizzes[0]), 'questions_quiz_archived_idx')
+
+
+class SearchCase(QuizTestCase):
+    def test_search(self):
+        quiz = self.create_quiz(0, 0)
+        other_author = get_user_model().objects.create(username='author', is_superuser=True)
+        type_question = TypeQuestion.objects.get(id=1)
+        texts = ['Какая ёлка вам нравится?', 'Любимая елка и игрушки', 'Ваш город', 'Ёлки ёлки ёлки']
+        questions = [Question.objects.create(quiz=quiz, question=text, position=i, type_question=type_question)
+                     for i, text in enumerate(texts)]
+        UserAnswer.objects.create(visitor=self.visitor, question=questions[2], answer_text='Живу в Санкт-Петербурге')
+        UserAnswer.objects.create(visitor=self.visitor, question=questions[0], answer_text=None)
+
+        url = f'/api/v1/search/?token={self.author.id}&q=ЕЛК'
+        response = self.client.get(url + '&limit=2')
+        # Префикс, регистр и ё -> е; чаще встречающееся слово выше.
+        self.assertEqual([_['id'] for _ in response.json()['results']], [questions[3].id, questions[0].id])
+        self.assertEqual(response.json()['next_offset'], 2)
+        response = self.client.get(url + '&limit=2&offset=2')
+        self.assertEqual(response.json(), {'results': [{'id': questions[1].id, 'quiz': quiz.id, 'question': texts[1],
+                                                        'archived': False, 'rank': mock.ANY}], 'next_offset': None})
+        self.assertEqual(self.client.get(f'/api/v1/search/?token={other_author.id}&q=елка').json()['results'], [])
+
+        questions[1].question = 'Любимые игрушки'
+        questions[1].save()
+        self.assertEqual(len(self.client.get(url).json()['results']), 2)
+        response = self.client.get(f'/api/v1/search/?token={self.author.id}&q=санкт петерб&scope=answers')
+        self.assertEqual(response.json()['results'][0]['answer_text'], 'Живу в Санкт-Петербурге')
+        # Синтаксис FTS5 в запросе не работает.
+        response = self.client.get(f'/api/v1/search/?token={self.author.id}&q=город OR "NEAR(&scope=questions')
+        self.assertEqual(response.json()['results'], [])
+        # Без FTS5 тот же поиск идет через icontains, ё -> е и в запросе, и в тексте.
+        # LIKE в SQLite не различает регистр только для латиницы, в PostgreSQL и MySQL - для любых букв.
+        with mock.patch.object(search.connection, 'vendor', 'postgresql'):
+            self.assertEqual([_['id'] for _ in search.search('questions', 'ёлк', self.author.id, 10, 0)],
+                             [questions[3].id, questions[0].id])
+            self.assertEqual([_['answer_text'] for _ in search.search('answers', 'Петерб', self.author.id, 10, 0)],
+                             ['Живу в Санкт-Петербурге'])
+
+    def test_search_index(self):
+        # Тестовая база собрана миграциями: если новая миграция пересоздаст questions или visitor_answers,
+        # триггеры индекса пропадут и тест это покажет.
+        with connection.cursor() as cursor:
+            self.assertEqual(search.missing_index_objects(cursor), [])
+            cursor.execute('DROP TRIGGER question_search_insert')
+            self.assertEqual(search.missing_index_objects(cursor), ['question_search_insert'])
+        self.assertEqual([_.id for _ in checks.check_search_index(None, databases=['default'])], ['quiz.W001'])
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(checks.check_search_index(None, databases=['default']), [])
+        question = Question.objects.create(quiz=self.create_quiz(0, 0), question='Новогодняя ёлка', position=0,
+                                           type_question=TypeQuestion.objects.get(id=1))
+        self.assertEqual([_['id'] for _ in search.search('questions', 'елка', self.author.id, 10, 0)], [question.id])
+
+
+class QuizBatchCase(QuizTestCase):
+    def test_quiz_batch(self):
+        quizzes = [self.create_quiz(3, 2) for _ in range(5)]
+        services.get_quiz_snapshot(quizzes[0].id)
+        url = f'/api/v1/quiz/batch/?token={self.visitor.id}&quizzes=' + ','.join(
+            str(_) for _ in [quizzes[4].id, 0, quizzes[0].id, quizzes[1].id, quizzes[4].id, quizzes[2].id])
+        # Недостающие в кеше снимки собираются за 3 запроса, сколько бы опросов ни было.
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        data = response.json()
+        self.assertEqual([_['id'] for _ in data['quizzes']], [quizzes[_].id for _ in (4, 0, 1, 2)])
+        self.assertEqual(data['quizzes'][0], QuizSerializer(quizzes[4]).data)
+        self.assertEqual(data['missing'], [0])
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url).json(), data)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        services.update_quiz(quizzes[1].id, 'Новое название', None, None, self.author)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).json()['quizzes'][2]['name'],
+                         'Новое название')
+        response = self.client.get(f'/api/v1/quiz/batch/?quizzes=' + ','.join(str(_) for _ in range(1, 52)))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(f'/api/v1/quiz/batch/?quizzes=1,a').status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ActiveQuizSyncCase(QuizTestCase):
+    @override_settings(ACTIVE_QUIZ_SYNC_OVERLAP=0)
+    def test_active_quiz_sync(self):
+        quizzes = [self.create_quiz(2, 2) for _ in range(3)]
+        Quiz.objects.create(name='Будущий', description='', start=datetime.now() + timedelta(days=1),
+                            end=datetime.now() + timedelta(days=2), author=self.author)
+        url = f'/api/v1/quiz/active/?token={self.visitor.id}&since='
+
+        data = self.client.get(url + '0').json()
+        self.assertEqual(data['changed'], QuizSerializer(quizzes, many=True).data)
+        self.assertEqual(data['removed'], [])
+        # Без изменений ответ пустой.
+        data = self.client.get(url + str(data['token'])).json()
+        self.assertEqual((data['changed'], data['removed']), ([], []))
+
+        services.update_question(quizzes[0].question_set.first().id, {'text': 'Новый текст'}, self.author)
+        services.delete_quiz(quizzes[1].id, self.author)
+        Quiz.objects.filter(id=quizzes[2].id).update(end=datetime.now())
+        data = self.client.get(url + str(data['token'])).json()
+        self.assertEqual([_['id'] for _ in data['changed']], [quizzes[0].id])
+        self.assertEqual(data['changed'][0]['questions'][0]['question'], 'Новый текст')
+        self.assertEqual(data['removed'], [quizzes[1].id, quizzes[2].id])
+
+        answers = [{'id': question.id, 'variable': [question.variableanswer_set.first().id]}
+                   for question in quizzes[0].question_set.all()]
+        services.create_answer_quiz(quizzes[0].id, {'answers': answers}, self.visitor)
+        data = self.client.get(url + str(data['token'])).json()
+        self.assertEqual((data['changed'], data['removed']), ([], [quizzes[0].id]))
+        self.assertEqual(self.client.get(url + '-1').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(url + '99999999999999999999').status_code, status.HTTP_400_BAD_REQUEST)
+
+        # Опрос удален вместе с автором: строки опроса нет, id приходит из надгробия.
+        author = get_user_model().objects.create(username='author', is_superuser=True)
+        quiz = Quiz.objects.create(name='Удаляемый', description='', start=datetime.now() - timedelta(days=1),
+                                   end=datetime.now() + timedelta(days=1), author=author)
+        data = self.client.get(url + str(data['token'])).json()
+        self.assertEqual([_['id'] for _ in data['changed']], [quiz.id])
+        author.delete()
+        data = self.client.get(url + str(data['token'])).json()
+        self.assertEqual((data['changed'], data['removed']), ([], [quiz.id]))
+
+
+class ActiveQuizIdsCase(QuizTestCase):
+    @override_settings(ACTIVE_QUIZ_IDS_TIMEOUT=24 * 60 * 60)
+    def test_active_quiz_ids(self):
+        now = datetime.now()
+        quiz = self.create_quiz(0, 0)
+        future = Quiz.objects.create(name='Будущий', description='', start=now + timedelta(hours=1),
+                                     end=now + timedelta(hours=2), author=self.author)
+        active = services.get_active_quiz_ids()
+        self.assertEqual(active.ids, (quiz.id,))
+        # Набор живет до начала следующего опроса.
+        self.assertEqual(active.valid_until, future.start)
+        with self.assertNumQueries(0):
+            self.assertEqual(services.get_active_quiz_ids(), active)
+        with mock.patch('quiz.services.datetime') as mock_datetime:
+            mock_datetime.now.return_value = future.start
+            self.assertEqual(services.get_active_quiz_ids().ids, (quiz.id, future.id))
+
+        services.delete_quiz(quiz.id, self.author)
+        self.assertEqual(services.get_active_quiz_ids().ids, ())
+        with override_settings(ACTIVE_QUIZ_IDS_TIMEOUT=60):
+            services.create_quiz('Новый', '', (now - timedelta(days=1)).strftime('%d.%m.%Y %H:%M'),
+                                 (now + timedelta(days=1)).strftime('%d.%m.%Y %H:%M'), self.author)
+            active = services.get_active_quiz_ids()
+        self.assertEqual(len(active.ids), 1)
+        self.assertLessEqual(active.valid_until, datetime.now() + timedelta(seconds=60))
+        # update() не шлет post_save, набор сбрасывает refresh_quiz_snapshot.
+        Quiz.objects.filter(id=active.ids[0]).update(archived=True)
+        services.refresh_quiz_snapshot(active.ids[0])
+        self.assertEqual(services.get_active_quiz_ids().ids, ())
+
+
+class RenderersCase(QuizTestCase):
+    def test_renderers(self):
+        quiz = self.create_quiz(3, 2)
+        data = QuizSerializer(quiz).data
+        self.assertEqual(json.loads(ORJSONRenderer().render(data)), json.loads(JSONRenderer().render(data)))
+        self.assertEqual(ORJSONRenderer().render(None), b'')
+        self.assertEqual(ORJSONRenderer().render(data, 'application/json; indent=4'),
+                         JSONRenderer().render(data, 'application/json; indent=4'))
+        self.assertEqual(ORJSONRenderer().render(data, renderer_context={'indent': 4}),
+                         JSONRenderer().render(data, renderer_context={'indent': 4}))
+
+        url = f'/api/v1/quiz/?token={self.visitor.id}&quiz={quiz.id}'
+        response = self.client.get(url, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.json(), data)
+        self.assertIn('Accept', response['Vary'])
+        indented = self.client.get(url, HTTP_ACCEPT='application/json; indent=4')
+        self.assertEqual(indented.content, JSONRenderer().render(data, 'application/json; indent=4'))
+        self.assertNotEqual(indented['ETag'], response['ETag'])
+        # У каждого формата свой ETag, иначе кеш отдаст JSON клиенту, запросившему другой формат.
+        html = self.client.get(url, HTTP_ACCEPT='text/html')
+        self.assertEqual(html['Content-Type'], 'text/html; charset=utf-8')
+        self.assertNotEqual(html['ETag'], response['ETag'])
+        self.assertEqual(self.client.get(url, HTTP_ACCEPT='text/html', HTTP_IF_NONE_MATCH=response['ETag']).status_code,
+                         status.HTTP_200_OK)
+        if msgpack is None:
+            self.assertEqual(self.client.get(url, HTTP_ACCEPT='application/msgpack').status_code,
+                             status.HTTP_406_NOT_ACCEPTABLE)
+        else:
+            self.assertEqual(msgpack.unpackb(self.client.get(url, HTTP_ACCEPT='application/msgpack').content), data)
+
+
+class RowsCase(QuizTestCase):
+    def test_rows(self):
+        quizzes = [self.create_quiz(3, 2), self.create_quiz(0, 0), self.create_quiz(2, 0)]
+        Quiz.objects.filter(id=quizzes[1].id).update(archived=True)
+        Question.objects.filter(quiz=quizzes[0], position=1).update(archived=True)
+        queryset = Quiz.objects.filter(id__in=[_.id for _ in quizzes])
+        render = JSONRenderer().render
+        # Облегченная сериализация должна отдавать ровно те же байты, что и сериализаторы DRF.
+        with self.assertNumQueries(3):
+            data = [rows.quiz_data(quiz) for quiz in rows.load_quizzes(queryset)]
+        self.assertEqual(render(data), render(QuizSerializer(prefetch_quiz(queryset), many=True).data))
+        with self.assertNumQueries(2):
+            rows.load_quizzes(queryset.filter(id=quizzes[1].id))
+
+        questions = list(Question.objects.filter(quiz=quizzes[0]))
+        variable_answers = list(VariableAnswer.objects.filter(question__quiz=quizzes[0]).order_by('-id'))
+        answers = [UserAnswer.objects.create(visitor=self.visitor, question=questions[0], answer_text='Ответ'),
+                   UserAnswer.objects.create(visitor=self.visitor, question=questions[2]),
+                   UserAnswer.objects.create(visitor=self.visitor, question=questions[0])]
+        answers[1].variable_answer.set(variable_answers[:2])
+        for quiz in quizzes: QuizCompletion.objects.create(visitor=self.visitor, quiz=quiz)
+        completed = Quiz.objects.filter(id__in=[_.id for _ in quizzes]).order_by('id')
+        expected = QuizHistorySerializer(completed, many=True).data
+        for quiz in expected:
+            quiz['answers'] = HistoryAnswersSerializer(UserAnswer.objects.filter(
+                visitor=self.visitor, question__quiz_id=quiz['id']).order_by('id'), many=True).data
+        with self.assertNumQueries(3):
+            history = rows.history_answers(self.visitor)
+        self.assertEqual(render(history), render(expected))
+        self.assertEqual(render(rows.history_answers(self.visitor, cursor=quizzes[0].id, limit=1)), render(expected[1:2]))
+
+
+class QuizCompletionCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        type_question = TypeQuestion.objects.create(name='Ответ текстом')
+        cls.author = get_user_model().objects.create(username='root', is_superuser=True)
+        cls.visitor = get_user_model().objects.create(username='visitor', is_superuser=False)
+        cls.quiz = Quiz.objects.create(name='Title', description='Description', start=datetime.now() - timedelta(days=1),
+                                       end=datetime.now() + timedelta(days=1), author=cls.author)
+        cls.question = Question.objects.create(quiz=cls.quiz, question='Вопрос', position=0, type_question=type_question)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_create_answer(self):
+        answers = {'answers': [{'id': self.question.id, 'text': 'Ответ'}]}
+        self.assertEqual(services.create_answer_quiz(self.quiz.id, answers, self.visitor)[1], 0)
+        self.assertTrue(QuizCompletion.objects.filter(visitor=self.visitor, quiz=self.quiz).exists())
+        self.assertIsNone(services.get_active_quiz(self.visitor))
+        self.assertEqual(services.create_answer_quiz(self.quiz.id, answers, self.visitor)[1], 1)
+        self.assertEqual(UserAnswer.objects.filter(visitor=self.visitor).count(), 1)
+
+    def test_create_answer_query_count(self):
+        type_question = TypeQuestion.objects.create(id=3, name='Выбрать несколько вариантов')
+        for count_questions in (2, 50):
+            quiz = Quiz.objects.create(name='Title', description='Description', start=self.quiz.start,
+                                       end=self.quiz.end, author=self.author)
+            answers = []
+            for i in range(count_questions):
+                question = Question.objects.create(quiz=quiz, question=f'Вопрос {i}', position=i,
+                                                   type_question=type_question)
+                variables = [VariableAnswer.objects.create(text=f'Вариант {j}', question=question).id for j in range(3)]
+                answers.append({'id': question.id, 'variable': variables[:2]})
+            # Опрос, проверка прохождения, вопросы, варианты, 2 точки сохранения,
+            # отметка о прохождении, ответы, их id, связи с вариантами и 4 запроса на статистику.
+            with self.assertNumQueries(14):
+                self.assertEqual(services.create_answer_quiz(quiz.id, {'answers': answers}, self.visitor)[1], 0)
+            self.assertEqual(UserAnswer.variable_answer.through.objects.filter(useranswer__question__quiz=quiz).count(),
+                             count_questions * 2)
+
+    def test_history(self):
+        other_visitor = get_user_model().objects.create(username='other', is_superuser=False)
+        quizzes = [self.quiz]
+        for i in range(4):
+            quiz = Quiz.objects.create(name=f'Title {i}', description='Description', start=self.quiz.start,
+                                       end=self.quiz.end, author=self.author)
+            Question.objects.create(quiz=quiz, question='Вопрос', position=0, type_question=self.question.type_question)
+            quizzes.append(quiz)
+        for quiz in quizzes:
+            for visitor in (self.visitor, other_visitor):
+                answers = {'answers': [{'id': quiz.question_set.get().id, 'text': visitor.username}]}
+                services.create_answer_quiz(quiz.id, answers, visitor)
+
+        # Опросы, ответы и их варианты - на любом размере страницы.
+        with self.assertNumQueries(3):
+            page = services.get_history_answers(self.visitor, limit=3)
+        self.assertEqual([quiz['id'] for quiz in page], [quiz.id for quiz in quizzes[:3]])
+        self.assertEqual({answer['answer_text'] for quiz in page for answer in quiz['answers']}, {'visitor'})
+
+        response = self.client.get(f'/api/v1/visitor/answers/?token={self.visitor.id}&limit=3&cursor={page[-1]["id"]}')
+        self.assertEqual([quiz['id'] for quiz in response.data['results']], [quiz.id for quiz in quizzes[3:]])
+        self.assertIsNone(response.data['next_cursor'])
+
+        response = self.client.get(f'/api/v1/visitor/answers/?token={self.visitor.id}&stream=1')
+        history = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(history, json.loads(json.dumps(services.get_history_answers(self.visitor))))
+        self.assertEqual(len(history), 5)
+
+    def test_backfill(self):
+        UserAnswer.objects.create(visitor=self.visitor, answer_text='Ответ', question=self.question)
+        UserAnswer.objects.create(visitor=self.visitor, answer_text='Ответ', question=self.question)
+        call_command('backfill_quiz_completion', stdout=StringIO())
+        call_command('backfill_quiz_completion', stdout=StringIO())
+        self.assertEqual(list(QuizCompletion.objects.values_list('visitor_id', 'quiz_id')),
+                         [(self.visitor.id, self.quiz.id)])
+
+
+class AnswerQueueCase(QuizTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.quiz = cls.create_quiz(1, 0, type_question_id=1)
+        cls.question = cls.quiz.question_set.get()
+
+    def test_answer_queue(self):
+        with tempfile.TemporaryDirectory() as directory, \
+                override_settings(ANSWER_QUEUE_ENABLED=True, ANSWER_QUEUE_PATH=os.path.join(directory, 'queue.sqlite3')):
+            visitors = [get_user_model().objects.create(username=f'visitor{i}') for i in range(3)]
+            for visitor in visitors:
+                answers = {'answers': [{'id': self.question.id, 'text': visitor.username}]}
+                response = self.client.post(f'/api/v1/quiz/create_answer/?token={visitor.id}&quiz={self.quiz.id}',
+                                            data=json.dumps(answers), content_type='application/json')
+                self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+                # Прохождение зарезервировано сразу, повторная отправка отклоняется.
+                response = self.client.post(f'/api/v1/quiz/create_answer/?token={visitor.id}&quiz={self.quiz.id}',
+                                            data=json.dumps(answers), content_type='application/json')
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertEqual(answer_queue.depth(), {'pending': 3, 'failed': 0})
+            self.assertFalse(UserAnswer.objects.exists())
+
+            # Взятые в аренду записи другой воркер не получает.
+            items = answer_queue.take(2) + answer_queue.take(10)
+            self.assertEqual(len(items), 3)
+            self.assertEqual(answer_queue.take(10), [])
+            answer_queue.release([item[0] for item in items])
+
+            # База недоступна: ответы остаются в очереди и не помечаются ошибкой.
+            with override_settings(ANSWER_QUEUE_LEASE_TIMEOUT=-1), \
+                    mock.patch.object(services, 'save_answers', side_effect=OperationalError('database is locked')), \
+                    self.assertLogs('quiz.services', 'ERROR'):
+                self.assertEqual(services.drain_answer_queue(10), 0)
+            self.assertEqual(answer_queue.depth(), {'pending': 3, 'failed': 0})
+
+            answer_queue.put(self.visitor.id, self.quiz.id, [{'id': 0, 'text': 'Битый ответ'}])
+            with self.assertLogs('quiz.services', 'ERROR'):
+                call_command('answer_queue', drain=True, batch_size=10, stdout=StringIO())
+            self.assertEqual(answer_queue.depth(), {'pending': 0, 'failed': 1})
+            self.assertEqual(sorted(UserAnswer.objects.values_list('answer_text', flat=True)),
+                             [visitor.username for visitor in visitors])
+
+            # Воркер упал после записи в базу, не подтвердив записи: после окончания аренды они не пишутся второй раз.
+            answer_queue.put(visitors[0].id, self.quiz.id, [{'id': self.question.id, 'text': visitors[0].username}])
+            with override_settings(ANSWER_QUEUE_LEASE_TIMEOUT=-1):
+                self.assertEqual(services.drain_answer_queue(10), 1)
+            self.assertEqual(UserAnswer.objects.count(), 3)
+            self.assertEqual(QuizTally.objects.get(quiz=self.quiz).responses, 3)
+
+            with self.assertLogs('quiz.services', 'ERROR'):
+                call_command('answer_queue', drain=True, retry_failed=True, stdout=StringIO())
+            self.assertEqual(answer_queue.depth(), {'pending': 0, 'failed': 1})
+
+
+class AsyncViewsCase(TransactionTestCase):
+    # Асинхронные представления ходят в базу из пула потоков со своими соединениями,
+    # данные из незакоммиченной транзакции TestCase они бы не увидели.
+    def setUp(self):
+        cache.clear()
+        token_cache.clear()
+        type_question = TypeQuestion.objects.create(name='Ответ текстом')
+        author = get_user_model().objects.create(username='root', is_superuser=True)
+        self.visitor = get_user_model().objects.create(username='visitor', is_superuser=False)
+        self.quiz = Quiz.objects.create(name='Title', description='Description', start=datetime.now() - timedelta(days=1),
+                                        end=datetime.now() + timedelta(days=1), author=author)
+        self.question = Question.objects.create(quiz=self.quiz, question='Вопрос', position=0, type_question=type_question)
+
+    def get(self, view, url):
+        response = async_to_sync(view)(RequestFactory().get(url))
+        return response.status_code, json.loads(response.content or 'null')
+
+    def test_async_views(self):
+        code, data = self.get(async_views.active_quiz_view, f'/?token={self.visitor.id}')
+        self.assertEqual((code, data[0]['id']), (status.HTTP_200_OK, self.quiz.id))
+        code, data = self.get(async_views.quiz_view, f'/?quiz={self.quiz.id}')
+        self.assertEqual(data['questions'][0]['id'], self.question.id)
+        code, data = self.get(async_views.quiz_view, f'/?quiz={2 ** 63}')
+        self.assertEqual(code, status.HTTP_400_BAD_REQUEST)
+
+        services.create_answer_quiz(self.quiz.id, {'answers': [{'id': self.question.id, 'text': 'Ответ'}]}, self.visitor)
+        code, data = self.get(async_views.active_quiz_view, f'/?token={self.visitor.id}')
+        self.assertEqual((code, data), (status.HTTP_204_NO_CONTENT, None))
+        code, data = self.get(async_views.visitor_history_answer_view, f'/?token={self.visitor.id}&limit=1')
+        self.assertEqual(data['results'][0]['answers'][0]['answer_text'], 'Ответ')
+        code, data = self.get(async_views.active_quiz_view, f'/?token={self.visitor.id}&since=0')
+        self.assertEqual((data['changed'], data['removed']), ([], []))
+        code, data = self.get(async_views.active_quiz_view, f'/?token={self.visitor.id}&since={data["token"] * 2}')
+        self.assertEqual(code, status.HTTP_400_BAD_REQUEST)
+        code, data = self.get(async_views.visitor_history_answer_view, '/?token=0')
+        self.assertEqual(code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_concurrency(self):
+        # Медленные вызовы базы из разных запросов должны идти параллельно, а не по очереди в одном потоке.
+        check_user = services.check_user
+
+        def slow_check_user(token):
+            time.sleep(0.2)
+            return check_user(token)
+
+        async def requests(count):
+            return await asyncio.gather(*(async_views.active_quiz_view(
+                RequestFactory().get(f'/?token={self.visitor.id}')) for _ in range(count)))
+
+        with mock.patch.object(services, 'check_user', slow_check_user):
+            start = time.perf_counter()
+            responses = async_to_sync(requests)(5)
+            elapsed = time.perf_counter() - start
+        self.assertEqual([_.status_code for _ in responses], [status.HTTP_200_OK] * 5)
+        self.assertLess(elapsed, 0.6)
+
+    def test_metrics(self):
+        # Запросы из потоков sync_to_async относятся к своему HTTP-запросу.
+        metrics.clear()
+        async_to_sync(AsyncClient().get)(f'/api/v1/async/quiz/active/?token={self.visitor.id}')
+        text = self.client.get('/metrics/').content.decode()
+        self.assertIn('quiz_request_duration_seconds_count{view="async_active_quiz",method="GET"} 1', text)
+        self.assertRegex(text, r'quiz_request_queries_sum\{view="async_active_quiz",method="GET"\} [1-9]')
+
+
+class TypeQuestionRegistryCase(TestCase):
+    def test_empty_table(self):
+        # Реестр прочитан до generate_type_question: пустая таблица не запоминается.
+        type_question_registry.clear()
+        self.addCleanup(type_question_registry.clear)
+        self.assertEqual(type_question_registry.load(), {})
+        type_question = TypeQuestion.objects.bulk_create([TypeQuestion(name='Ответ текстом')])[0]
+        type_question = TypeQuestion.objects.get(name=type_question.name)
+        self.assertEqual(type_question_registry.get(type_question.id), type_question)
+        with self.assertNumQueries(0):
+            type_question_registry.get(type_question.id)
+
+
+class TokenCacheCase(TestCase):
+    def setUp(self):
+        token_cache.clear()
+        self.user = get_user_model().objects.create(username='visitor', is_superuser=False)
+
+    def test_check_user(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(services.check_user(self.user.id), self.user)
+            self.assertEqual(services.check_user(str(self.user.id)), self.user)
+        self.assertEqual(token_cache.stats(), {'size': 1, 'hits': 1, 'misses': 1})
+
+        # Изменение пользователя сбрасывает кеш.
+        self.user.is_superuser = True
+        self.user.save()
+        self.assertTrue(services.check_user(self.user.id).is_superuser)
+        self.user.delete()
+        self.assertIsNone(services.check_user(self.user.id))
+        self.assertIsNone(services.check_user('token'))
+
+    def test_lru(self):
+        lru = TokenCache(maxsize=2, ttl=60)
+        for token in (1, 2, 1, 3): lru.get(token, lambda token: token)
+        self.assertEqual(list(lru._items), ['1', '3'])
+        self.assertEqual(lru.stats(), {'size': 2, 'hits': 1, 'misses': 3})
+        lru = TokenCache(maxsize=2, ttl=-1)
+        lru.get(1, lambda token: token)
+        lru.get(1, lambda token: token)
+        self.assertEqual(lru.stats()['misses'], 2)
+
+    def test_invalidate_during_load(self):
+        # Пользователь изменился, пока его читали из базы: прочитанное значение в кеш не попадает.
+        lru = TokenCache(maxsize=2, ttl=60)
+
+        def loader(token):
+            lru.invalidate(token)
+            return 'old'
+
+        self.assertEqual(lru.get(1, loader), 'old')
+        self.assertEqual(lru.get(1, lambda token: 'new'), 'new')
+        self.assertEqual(lru.get(1, loader), 'new')
+        self.assertEqual((lru._loading, lru._generations), ({}, {}))
+
+
+@override_settings(DATABASE_REPLICAS=['replica_0', 'replica_1'])
+class ReplicaRouterCase(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.router = ReplicaRouter()
+
+    def test_router(self):
+        self.assertEqual(self.router.db_for_read(Quiz), 'default')
+        with replica_reads() as alias:
+            self.assertIn(alias, ('replica_0', 'replica_1'))
+            self.assertEqual(self.router.db_for_read(Quiz), alias)
+            self.assertEqual(self.router.db_for_write(Quiz), 'default')
+            # Внутри транзакции чтения остаются на основной базе.
+            with mock.patch.object(connections['default'], 'in_atomic_block', True):
+                self.assertEqual(self.router.db_for_read(Quiz), 'default')
+        self.assertEqual(self.router.db_for_read(Quiz), 'default')
+        self.assertFalse(self.router.allow_migrate('replica_0', 'quiz'))
+
+    def test_sticky_primary(self):
+        for visitor_id, replica in ((2, 'replica_0'), (3, 'replica_1')):
+            with replica_reads(visitor_id):
+                self.assertEqual(self.router.db_for_read(UserAnswer), replica)
+        pin_primary(3)
+        with replica_reads(3) as alias:
+            self.assertIsNone(alias)
+            self.assertEqual(self.router.db_for_read(UserAnswer), 'default')
+        with replica_reads(2):
+            self.assertEqual(self.router.db_for_read(UserAnswer), 'replica_0')
+
+
+class ChecksCase(SimpleTestCase):
+    def test_snapshot_cache(self):
+        self.assertEqual(checks.check_snapshot_cache(None), [])
+        with override_settings(QUIZ_SNAPSHOT_TIMEOUT=None):
+            self.assertEqual([_.id for _ in checks.check_snapshot_cache(None)], ['quiz.E001'])
+        with override_settings(QUIZ_SNAPSHOT_TIMEOUT=None, CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': tempfile.gettempdir()}}):
+            self.assertEqual(checks.check_snapshot_cache(None), [])
+
+
+class OpenAPISchemaCase(SimpleTestCase):
+    def setUp(self):
+        get_schema.cache_clear()
+        self.addCleanup(get_schema.cache_clear)
+
+    def test_generate(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'dist', 'openapi.json')
+            call_command('generate_openapi_schema', output=path, stdout=StringIO())
+            with open(path) as schema_file: schema = json.load(schema_file)
+            self.assertIn('/search/', schema['paths'])
+
+            schema['info']['title'] = 'QuizAPI из файла'
+            with open(path, 'w') as schema_file: json.dump(schema, schema_file)
+            with override_settings(OPENAPI_SCHEMA_PATH=path):
+                response = self.client.get('/swagger/?format=openapi')
+                self.assertEqual(response.json(), schema)
+                self.assertEqual(self.client.get('/swagger/').status_code, 200)
+
+    def test_fallback(self):
+        with override_settings(OPENAPI_SCHEMA_PATH='/nonexistent/openapi.json'):
+            self.assertEqual(self.client.get('/swagger/?format=openapi').json()['info']['title'], 'QuizAPI')
+            self.assertIs(get_schema(), get_schema())
+
+
+class LoadToolsCase(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_seed_and_bench(self):
+        call_command('seed_load_data', quizzes=2, questions=3, options=2, visitors=5, answer_rate=1, stdout=StringIO())
+        self.assertEqual(QuizCompletion.objects.count(), 10)
+        self.assertEqual(UserAnswer.objects.count(), 30)
+
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'bench.json')
+            call_command('bench_api', iterations=3, output=output, stdout=StringIO())
+            with open(output) as report: report = json.load(report)
+            self.assertEqual(set(report['endpoints']), {'active_quiz', 'quiz', 'active_answer', 'visitor_answers'})
+            # Замеры не оставляют данных после себя.
+            self.assertEqual(QuizCompletion.objects.count(), 10)
+
+            report['endpoints']['visitor_answers']['queries'] = 0
+            with open(output, 'w') as baseline: json.dump(report, baseline)
+            with self.assertRaises(CommandError):
+                call_command('bench_api', iterations=3, baseline=output, endpoints=['visitor_answers'], stdout=StringIO())
+
+
+class CreateVisitorsCase(TestCase):
+    @override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+    def test_create_visitors(self):
+        output = StringIO()
+        call_command('create_visitors', count=5, chunk_size=2, workers=0, stdout=output)
+        rows = list(csv.DictReader(StringIO(output.getvalue())))
+        self.assertEqual(len(rows), 5)
+        for row in rows:
+            self.assertEqual(authenticate(username=row['username'], password=row['password']).id, int(row['id']))
+
+        # Один посетитель без --output: пароль тоже выводится, иначе под созданным пользователем не войти.
+        output = StringIO()
+        call_command('create_visitors', workers=0, stdout=output)
+        visitor = dict(line.split(': ') for line in output.getvalue().splitlines())
+        self.assertEqual(authenticate(username=visitor['username'], password=visitor['password']).id, int(visitor['id']))
+
+    @override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+    def test_username_collision(self):
+        get_user_model().objects.create(username='visitor_aaa')
+        output = StringIO()
+        # Занятое имя генерируется заново.
+        with mock.patch.object(create_visitors.fake, 'user_name', return_value='visitor'), \
+                mock.patch.object(create_visitors.secrets, 'token_hex', side_effect=['aaa', 'aaa', 'bbb', 'ccc']):
+            call_command('create_visitors', count=2, workers=0, stdout=output)
+        self.assertEqual(sorted(_['username'] for _ in csv.DictReader(StringIO(output.getvalue()))),
+                         ['visitor_bbb', 'visitor_ccc'])
+
+        # Имя заняли между проверкой и записью: не создается никто, даже из уже записанных пачек.
+        credentials = [('visitor_ddd', 'password'), ('visitor_aaa', 'password')]
+        with mock.patch.object(create_visitors.Command, 'generate_credentials', return_value=credentials), \
+                self.assertRaises(CommandError):
+            call_command('create_visitors', count=2, chunk_size=1, workers=0, stdout=StringIO())
+        self.assertFalse(get_user_model().objects.filter(username='visitor_ddd').exists())
+
+
+class MetricsCase(TestCase):
+    def setUp(self):
+        metrics.clear()
+        self.user = get_user_model().objects.create(username='visitor')
+
+    def test_metrics(self):
+        for _ in range(3): self.client.get(f'/api/v1/quiz/active/?token={self.user.id}')
+        with override_settings(SLOW_REQUEST_THRESHOLD=0), self.assertLogs('quiz.middleware', 'WARNING') as logs:
+            self.client.get(f'/api/v1/visitor/answers/?token={self.user.id}')
+        self.assertIn('SELECT', logs.output[0])
+
+        response = self.client.get('/metrics/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        text = response.content.decode()
+        self.assertIn('quiz_request_duration_seconds_count{view="active_quiz",method="GET"} 3', text)
+        self.assertIn('quiz_request_queries_count{view="visitor_answers",method="GET"} 1', text)
+        self.assertIn('quiz_request_queries_bucket{view="active_quiz",method="GET",le="+Inf"} 3', text)
+        self.assertNotIn('view="metrics"', text)
+
+    def test_query_recorder(self):
+        # Соединение открылось внутри чужого execute_wrapper: после выхода из блока остается только наша обертка.
+        def wrapper(execute, sql, params, many, context):
+            return execute(sql, params, many, context)
+
+        def query():
+            try:
+                with connection.execute_wrapper(wrapper):
+                    connection.cursor().execute('SELECT 1')
+                wrappers.extend(connection.execute_wrappers)
+            finally:
+                connection.close()
+
+        wrappers = []
+        thread = threading.Thread(target=query)
+        thread.start()
+        thread.join()
+        self.assertEqual(wrappers, [record_query])
+
+    def test_streaming_metrics(self):
+        # Запросы генератора потокового ответа выполняются после выхода из view и тоже учитываются.
+        token_cache.clear()
+        response = self.client.get(f'/api/v1/visitor/answers/?token={self.user.id}&stream=1')
+        self.assertNotIn('quiz_request_queries_count{view="visitor_answers"', self.client.get('/metrics/').content.decode())
+        self.assertEqual(b''.join(response.streaming_content), b'[]')
+        text = self.client.get('/metrics/').content.decode()
+        self.assertIn('quiz_request_queries_sum{view="visitor_answers",method="GET"} 2', text)
@@ -0,0 +1,76 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+class TokenCache:
+    # LRU токен -> пользователь с ограниченным временем жизни записи.
+    # Кешируются и ненайденные токены, поэтому при создании пользователя тоже нужно вызывать invalidate.
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        # Для токенов, которые сейчас загружаются: число загрузок и поколение, которое увеличивает invalidate.
+        self._loading = {}
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def get(self, token, loader):
+        token = str(token)
+        now = time.monotonic()
+        with self._lock:
+            item = self._items.get(token)
+            if item is not None and item[0] > now:
+                self._items.move_to_end(token)
+                self.hits += 1
+                return item[1]
+            self.misses += 1
+            self._loading[token] = self._loading.get(token, 0) + 1
+            generation = self._generations.get(token, 0)
+
+        try:
+            user = loader(token)
+        except Exception:
+            with self._lock: self._finish_loading(token)
+            raise
+        with self._lock:
+            # Если invalidate пришел во время загрузки, пользователь мог быть прочитан до изменения - не кешируем.
+            if self._generations.get(token, 0) == generation:
+                self._items[token] = (now + self.ttl, user)
+                self._items.move_to_end(token)
+                while len(self._items) > self.maxsize: self._items.popitem(last=False)
+            self._finish_loading(token)
+        return user
+
+    def _finish_loading(self, token):
+        if self._loading[token] > 1:
+            self._loading[token] -= 1
+        else:
+            del self._loading[token]
+            self._generations.pop(token, None)
+
+    def invalidate(self, token):
+        token = str(token)
+        with self._lock:
+            self._items.pop(token, None)
+            if token in self._loading: self._generations[token] = self._generations.get(token, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._items), 'hits': self.hits, 'misses': self.misses}
+
+
+token_cache = TokenCache(settings.TOKEN_CACHE_SIZE, settings.TOKEN_CACHE_TTL)
+
+
+def invalidate_user(sender, instance, **kwargs):
+    token_cache.invalidate(instance.id)
@@ -1,10 +1,65 @@
+import json
+
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
 from rest_framework import status
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 
-from . import services
+from . import analytics, export, search, services
+from .answer_queue import answer_queue
+from .metrics import metrics
+from .tokens import token_cache
+
+
+HISTORY_MAX_LIMIT = 100
+SEARCH_MAX_LIMIT = 50
+QUIZ_BATCH_MAX_SIZE = 50
+ANALYTICS_KINDS = ('distribution', 'crosstab', 'cooccurrence')
+
+
+def parse_int(value):
+    # Целое из параметра запроса (id, курсор, смещение). Значение вне 64-битного INTEGER SQLite не дойдет до базы
+    # (OverflowError в адаптере), поэтому это такая же ошибка формата, как и не число.
+    value = int(value)
+    if not -2 ** 63 <= value < 2 ** 63: raise ValueError(f'Значение вне диапазона: {value}')
+    return value
+
+
+def not_modified(request, etag, last_modified):
+    # 304, если у клиента актуальная версия (If-None-Match / If-Modified-Since), иначе None.
+    response = get_conditional_response(request, etag=quote_etag(etag), last_modified=last_modified)
+    if response: set_validators(response, etag, last_modified)
+    return response
+
+
+def set_validators(response, etag, last_modified):
+    response['ETag'] = quote_etag(etag)
+    if last_modified: response['Last-Modified'] = http_date(last_modified)
+    # Клиент может хранить ответ, но перед использованием обязан проверить его у сервера.
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def snapshot_response(request, snapshot):
+    # Снимок уже отрендерен в JSON и отдается как есть, для других форматов (msgpack, browsable API)
+    # и JSON с отступами (Accept: application/json; indent=4) рендерим заново.
+    renderer = request.accepted_renderer
+    rendered = renderer.format == 'json' and renderer.get_indent(request.accepted_media_type, {}) is None
+    etag = snapshot.etag if rendered else f'{snapshot.etag}.{renderer.format}'
+    response = not_modified(request, etag, snapshot.last_modified)
+    if not response:
+        if rendered:
+            response = HttpResponse(snapshot.content, content_type='application/json', status=status.HTTP_200_OK)
+        else:
+            response = Response(json.loads(snapshot.content), status=status.HTTP_200_OK)
+        set_validators(response, etag, snapshot.last_modified)
+    patch_vary_headers(response, ('Accept',))
+    return response
 
 
 class QuizAPIView(APIView):
@@ -19,10 +74,15 @@ class QuizAPIView(APIView):
 
         if not quiz_id: return Response({'error': 'В запросе отсутсвуют обязательные параметры.'},
                                         status=status.HTTP_400_BAD_REQUEST)
+        # Id входит в ключи кеша снимка: "01" и "1" не должны давать разные ключи.
+        try:
+            quiz_id = parse_int(quiz_id)
+        except ValueError:
+            return Response({'error': 'Проверьте формат'}, status=status.HTTP_400_BAD_REQUEST)
 
-        quiz = services.get_quiz(quiz_id=quiz_id)
+        quiz = services.get_quiz_snapshot(quiz_id=quiz_id)
         if not quiz: return Response({'message': 'Опрос не найден.'}, status=status.HTTP_204_NO_CONTENT)
-        return Response(quiz, status=status.HTTP_200_OK)
+        return snapshot_response(request, quiz)
 
     @swagger_auto_schema(
         manual_parameters=[
@@ -124,6 +184,144 @@ class QuizAPIView(APIView):
         return Response(status=status.HTTP_200_OK)
 
 
+class QuizStatsAPIView(APIView):
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter('token', openapi.IN_QUERY, type='string', description='User token', required=True),
+            openapi.Parameter('quiz', openapi.IN_QUERY, type='integer', description='Quiz id', required=True)
+        ],
+    )
+    def get(self, request):
+        token = request.query_params.get('token', None)
+        quiz_id = request.query_params.get('quiz', None)
+
+        if not token or not quiz_id:
+            return Response({'error': 'В запросе отсутсвуют обязательные параметры.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            quiz_id = parse_int(quiz_id)
+        except ValueError:
+            return Response({'error': 'Проверьте формат'}, status=status.HTTP_400_BAD_REQUEST)
+
+        user = services.check_user(token)
+        if not user or not user.is_superuser:
+            return Response({'error': 'Неверный токен пользователя или пользователь не является админом.'},
+                            status=status.HTTP_401_UNAUTHORIZED)
+
+        stats = services.get_quiz_stats(quiz_id=quiz_id, author=user)
+        if not stats: return Response({'error': 'Опрос не найден.'}, status=status.HTTP_204_NO_CONTENT)
+
+        return Response(stats, status=status.HTTP_200_OK)
+
+
+class QuizAnalyticsAPIView(APIView):
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter('token', openapi.IN_QUERY, type='string', description='User token', required=True),
+            openapi.Parameter('quiz', openapi.IN_QUERY, type='integer', description='Quiz id', required=True),
+            openapi.Parameter('kind', openapi.IN_QUERY, type='string', enum=ANALYTICS_KINDS,
+                              description='Тип отчета:\n'
+                                          '<code>distribution - распределение ответов</code>'
+                                          '<code>crosstab - таблица сопряженности двух вопросов</code>'
+                                          '<code>cooccurrence - совместный выбор вариантов</code>'),
+            openapi.Parameter('question_a', openapi.IN_QUERY, type='integer', description='Question id для crosstab'),
+            openapi.Parameter('question_b', openapi.IN_QUERY, type='integer', description='Question id для crosstab'),
+        ],
+    )
+    def get(self, request):
+        token = request.query_params.get('token', None)
+        quiz_id = request.query_params.get('quiz', None)
+        kind = request.query_params.get('kind', 'distribution')
+
+        if not token or not quiz_id or kind not in ANALYTICS_KINDS:
+            return Response({'error': 'В запросе отсутсвуют обязательные параметры.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            quiz_id = parse_int(quiz_id)
+            question_a = parse_int(request.query_params.get('question_a', 0))
+            question_b = parse_int(request.query_params.get('question_b', 0))
+        except ValueError:
+            return Response({'error': 'Проверьте формат'}, status=status.HTTP_400_BAD_REQUEST)
+        if kind == 'crosstab' and (not question_a or not question_b):
+            return Response({'error': 'В запросе отсутсвуют обязательные параметры.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        user = services.check_user(token)
+        if not user or not user.is_superuser:
+            return Response({'error': 'Неверный токен пользователя или пользователь не является админом.'},
+                            status=status.HTTP_401_UNAUTHORIZED)
+        if analytics.np is None:
+            return Response({'error': 'Для аналитики на сервере должен быть установлен numpy.'},
+                            status=status.HTTP_501_NOT_IMPLEMENTED)
+
+        data = services.get_quiz_analytics(quiz_id=quiz_id, author=user, kind=kind,
+                                           question_a=question_a, question_b=question_b)
+        if not data: return Response({'error': 'Опрос не найден.'}, status=status.HTTP_204_NO_CONTENT)
+
+        return Response(data, status=status.HTTP_200_OK)
+
+
+class QuizExportAPIView(APIView):
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter('token', openapi.IN_QUERY, type='string', description='User token', required=True),
+            openapi.Parameter('quiz', openapi.IN_QUERY, type='integer', description='Quiz id', required=True),
+            openapi.Parameter('output', openapi.IN_QUERY, type='string', enum=tuple(export.CONTENT_TYPES),
+                              description='Формат выгрузки, по умолчанию csv.'),
+        ],
+    )
+    def get(self, request):
+        token = request.query_params.get('token', None)
+        quiz_id = request.query_params.get('quiz', None)
+        export_format = request.query_params.get('output', 'csv')
+
+        if not token or not quiz_id or export_format not in export.CONTENT_TYPES:
+            return Response({'error': 'В запросе отсутсвуют обязательные параметры.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            quiz_id = parse_int(quiz_id)
+        except ValueError:
+            return Response({'error': 'Проверьте формат'}, status=status.HTTP_400_BAD_REQUEST)
+
+        user = services.check_user(token)
+        if not user or not user.is_superuser:
+            return Response({'error': 'Неверный токен пользователя или пользователь не является админом.'},
+                            status=status.HTTP_401_UNAUTHORIZED)
+
+        rows = services.export_quiz_answers(quiz_id=quiz_id, author=user, export_format=export_format)
+        if rows is None: return Response({'error': 'Опрос не найден.'}, status=status.HTTP_204_NO_CONTENT)
+
+        response = StreamingHttpResponse(rows, content_type=export.CONTENT_TYPES[export_format])
+        response['Content-Disposition'] = f'attachment; filename="quiz_{quiz_id}.{export_format}"'
+        return response
+
+
+class QuizBatchAPIView(APIView):
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter('token', openapi.IN_QUERY, type='string', description='User token', required=True),
+            openapi.Parameter('quizzes', openapi.IN_QUERY, type='string', required=True,
+                              description=f'Id опросов через запятую, не больше {QUIZ_BATCH_MAX_SIZE}.'),
+        ],
+        responses={200: '{"quizzes": [опрос, ...], "missing": [id ненайденных опросов]}'},
+    )
+    def get(self, request):
+        quiz_ids = request.query_params.get('quizzes', None)
+
+        if not quiz_ids: return Response({'error': 'В запросе отсутсвуют обязательные параметры.'},
+                                         status=status.HTTP_400_BAD_REQUEST)
+        try:
+            quiz_ids = list(dict.fromkeys(parse_int(quiz_id) for quiz_id in quiz_ids.split(',')))
+        except ValueError:
+            return Response({'error': 'Проверьте формат'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(quiz_ids) > QUIZ_BATCH_MAX_SIZE:
+            return Response({'error': f'Можно запросить не больше {QUIZ_BATCH_MAX_SIZE} опросов.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        batch = services.get_quiz_batch(quiz_ids)
+        return snapshot_response(request, batch)
+
+
 class QuestionAPIView(APIView):
     @swagger_auto_schema(
         manual_parameters=[
@@ -232,6 +430,9 @@ class ActiveQuizAPIView(APIView):
     @swagger_auto_schema(
         manual_parameters=[
             openapi.Parameter('token', openapi.IN_QUERY, type='string', description='User token', required=True),
+            openapi.Parameter('since', openapi.IN_QUERY, type='integer',
+                              description='Токен из предыдущего ответа, 0 - первая синхронизация. '
+                                          'Ответ: {"token", "changed": [опрос, ...], "removed": [id опроса, ...]}'),
         ],
     )
     def get(self, request):
@@ -239,14 +440,24 @@ class ActiveQuizAPIView(APIView):
 
         if not token: return Response({'error': 'В запросе отсутсвуют обязательные параметры.'},
                                       status=status.HTTP_400_BAD_REQUEST)
+        try:
+            since = request.query_params.get('since', None)
+            if since is not None: since = int(since)
+        except ValueError:
+            return Response({'error': 'Проверьте формат'}, status=status.HTTP_400_BAD_REQUEST)
+        # Токен выдает сервер, токен из будущего - ошибка клиента (а огромные значения не переводятся в дату).
+        if since is not None and not 0 <= since <= services.sync_token():
+            return Response({'error': 'Проверьте формат'}, status=status.HTTP_400_BAD_REQUEST)
 
         user = services.check_user(token)
         if not user:
             return Response({'error': 'Неверный токен пользователя или пользователь не является админом.'},
                             status=status.HTTP_401_UNAUTHORIZED)
+        if since is not None: return Response(services.get_active_quiz_changes(user, since), status=status.HTTP_200_OK)
+
         quiz = services.get_active_quiz(user)
         if not quiz: return Response({'message': 'Активных опросов нет.'}, status=status.HTTP_204_NO_CONTENT)
-        return Response(quiz, status=status.HTTP_200_OK)
+        return snapshot_response(request, quiz)
 
 
 class QuizCreateAnswerAPIView(APIView):
@@ -275,6 +486,10 @@ class QuizCreateAnswerAPIView(APIView):
         quiz_id = request.query_params.get('quiz', None)
         if not token or not quiz_id: return Response({'error': 'В запросе отсутсвуют обязательные параметры.'},
                                                      status=status.HTTP_400_BAD_REQUEST)
+        try:
+            quiz_id = parse_int(quiz_id)
+        except ValueError:
+            return Response({'error': 'Проверьте формат'}, status=status.HTTP_400_BAD_REQUEST)
         answers = request.data.get('answers', None)
         if not isinstance(answers, list):
             return Response({'error': 'Проверьте формат'}, status=status.HTTP_400_BAD_REQUEST)
@@ -283,16 +498,68 @@ class QuizCreateAnswerAPIView(APIView):
         if not user:
             return Response({'error': 'Неверный токен пользователя или пользователь не является админом.'},
                             status=status.HTTP_401_UNAUTHORIZED)
+        if settings.ANSWER_QUEUE_ENABLED:
+            request_body, error = services.enqueue_answer_quiz(quiz_id=quiz_id, answers=request.data, visitor=user)
+            if error: return Response(request_body, status.HTTP_400_BAD_REQUEST)
+            return Response(request_body, status=status.HTTP_202_ACCEPTED)
+
         request_body, error = services.create_answer_quiz(quiz_id=quiz_id, answers=request.data, visitor=user)
         if error: return Response(request_body, status.HTTP_400_BAD_REQUEST)
 
         return Response(request_body, status=status.HTTP_200_OK)
 
 
+class SearchAPIView(APIView):
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter('token', openapi.IN_QUERY, type='string', description='User token', required=True),
+            openapi.Parameter('q', openapi.IN_QUERY, type='string', description='Слова для поиска, ищутся по префиксу.',
+                              required=True),
+            openapi.Parameter('scope', openapi.IN_QUERY, type='string', enum=search.SCOPES,
+                              description='Где искать:\n'
+                                          '<code>questions - тексты вопросов</code>'
+                                          '<code>answers - текстовые ответы пользователей</code>'),
+            openapi.Parameter('limit', openapi.IN_QUERY, type='integer',
+                              description=f'Размер страницы, максимум {SEARCH_MAX_LIMIT}.'),
+            openapi.Parameter('offset', openapi.IN_QUERY, type='integer',
+                              description='Значение next_offset с предыдущей страницы.'),
+        ],
+    )
+    def get(self, request):
+        token = request.query_params.get('token', None)
+        query = request.query_params.get('q', None)
+        scope = request.query_params.get('scope', 'questions')
+
+        if not token or not query or scope not in search.SCOPES:
+            return Response({'error': 'В запросе отсутсвуют обязательные параметры.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = int(request.query_params.get('limit', SEARCH_MAX_LIMIT))
+            offset = parse_int(request.query_params.get('offset', 0))
+        except ValueError:
+            return Response({'error': 'Проверьте формат'}, status=status.HTTP_400_BAD_REQUEST)
+        if limit <= 0 or offset < 0: return Response({'error': 'Проверьте формат'}, status=status.HTTP_400_BAD_REQUEST)
+
+        user = services.check_user(token)
+        if not user or not user.is_superuser:
+            return Response({'error': 'Неверный токен пользователя или пользователь не является админом.'},
+                            status=status.HTTP_401_UNAUTHORIZED)
+
+        data = services.search_quizzes(user, query, scope, min(limit, SEARCH_MAX_LIMIT), offset)
+        return Response(data, status=status.HTTP_200_OK)
+
+
 class VisitorHistoryAnswerAPIView(APIView):
     @swagger_auto_schema(
         manual_parameters=[
             openapi.Parameter('token', openapi.IN_QUERY, type='string', description='User token', required=True),
+            openapi.Parameter('limit', openapi.IN_QUERY, type='integer',
+                              description=f'Размер страницы, максимум {HISTORY_MAX_LIMIT}. '
+                                          f'Без него возвращается вся история.'),
+            openapi.Parameter('cursor', openapi.IN_QUERY, type='integer',
+                              description='Значение next_cursor с предыдущей страницы.'),
+            openapi.Parameter('stream', openapi.IN_QUERY, type='boolean',
+                              description='Отдать всю историю потоком, без пагинации.'),
         ],
     )
     def get(self, request):
@@ -300,11 +567,37 @@ class VisitorHistoryAnswerAPIView(APIView):
 
         if not token: return Response({'error': 'В запросе отсутсвуют обязательные параметры.'},
                                       status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = int(request.query_params.get('limit', 0))
+            cursor = parse_int(request.query_params.get('cursor', 0))
+        except ValueError:
+            return Response({'error': 'Проверьте формат'}, status=status.HTTP_400_BAD_REQUEST)
+        if limit < 0 or cursor < 0: return Response({'error': 'Проверьте формат'}, status=status.HTTP_400_BAD_REQUEST)
 
         user = services.check_user(token)
         if not user:
             return Response({'error': 'Неверный токен пользователя или пользователь не является админом.'},
                             status=status.HTTP_401_UNAUTHORIZED)
 
-        history_answers = services.get_history_answers(user)
-        return Response(history_answers, status=status.HTTP_200_OK)
+        if request.query_params.get('stream', None) in ('1', 'true'):
+            return StreamingHttpResponse(services.stream_history_answers(user, HISTORY_MAX_LIMIT),
+                                         content_type='application/json')
+        if not limit and not cursor:
+            return Response(services.get_history_answers(user), status=status.HTTP_200_OK)
+
+        limit = min(limit or HISTORY_MAX_LIMIT, HISTORY_MAX_LIMIT)
+        history_answers = services.get_history_answers(user, cursor=cursor, limit=limit)
+        next_cursor = history_answers[-1]['id'] if len(history_answers) == limit else None
+        return Response({'results': history_answers, 'next_cursor': next_cursor}, status=status.HTTP_200_OK)
+
+
+def metrics_view(request):
+    token_stats = token_cache.stats()
+    values = [('quiz_token_cache_hits_total', 'counter', 'Токен найден в кеше.', token_stats['hits']),
+              ('quiz_token_cache_misses_total', 'counter', 'Токена не было в кеше.', token_stats['misses']),
+              ('quiz_token_cache_size', 'gauge', 'Токенов в кеше.', token_stats['size'])]
+    if settings.ANSWER_QUEUE_ENABLED:
+        depth = answer_queue.depth()
+        values += [('quiz_answer_queue_pending', 'gauge', 'Ответов ждут записи.', depth['pending']),
+                   ('quiz_answer_queue_failed', 'gauge', 'Ответов не удалось записать.', depth['failed'])]
+    return HttpResponse(metrics.render(values), content_type='text/plain; version=0.0.4; charset=utf-8')